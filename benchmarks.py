@@ -0,0 +1,418 @@
+"""
+Benchmarks of the plotting pipeline, on the simulated
+plotter (Plotter(sim=True)) and the pure python stages,
+with synthetic workloads and the bundled hand.pkl.
+
+usage:
+    python3 benchmarks.py                    # everything, default sizes
+    python3 benchmarks.py --scale 4          # 4x bigger workloads
+    python3 benchmarks.py --only sched_paths,move_to -o after.json
+    python3 benchmarks.py --compare before.json after.json
+
+Results are JSON: for each benchmark the workload size and
+the best/mean/all times of --repeat runs, so runs before
+and after a change can be compared.
+"""
+import contextlib, io, json, os, pickle, platform, shutil, subprocess, sys, tempfile, time
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BENCHMARKS = {}
+
+def benchmark(size):
+    """
+    Registers a benchmark with its default workload size.
+    The function takes the size and returns the callable to time.
+    """
+    def register(F):
+        BENCHMARKS[F.__name__.replace('bench_','')] = (F, size)
+        return F
+    return register
+
+SCRATCH = []
+
+def scratch_dir():
+    """
+    A temporary directory for a benchmark's files,
+    removed once the benchmark is timed.
+    """
+    tmp = tempfile.mkdtemp()
+    SCRATCH.append(tmp)
+    return tmp
+
+@contextlib.contextmanager
+def quiet():
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+def random_paths(n, length=20, width=100., height=60., seed=0):
+    """
+    n random walk paths of about length vertices.
+    """
+    rng = np.random.default_rng(seed)
+    paths = []
+    for K in range(n):
+        m = int(rng.integers(2, 2*length))
+        start = rng.random(2)*[width, height]
+        paths.append((start + np.cumsum(rng.normal(0, 0.5, (m,2)), 0)).tolist())
+    return paths
+
+def random_image(n, seed=0):
+    """
+    A smooth n x n x 3 uint8 image with some noise.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 1, n)
+    base = 127.*(1.+np.sin(6.*x[:,None])*np.cos(4.*x[None,:]))
+    img = base[:,:,None] + rng.normal(0, 20, (n,n,3))
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+def make_plotter():
+    import plotter
+    with quiet():
+        return plotter.Plotter(sim=True)
+
+@benchmark(5000)
+def bench_sched_paths(n):
+    pl = make_plotter()
+    paths = random_paths(n)
+    def run():
+        with quiet():
+            pl.sched_paths(paths)
+    return run
+
+@benchmark(5000)
+def bench_scale_paths(n):
+    pl = make_plotter()
+    paths = random_paths(n)
+    cbds = pl.paths_bounds(paths)
+    def run():
+        pl.scale_paths(paths, cbds)
+    return run
+
+@benchmark(2000)
+def bench_move_to(n):
+    """
+    n vertices stepped one move_to at a time.
+    """
+    pl = make_plotter()
+    xy = np.array(pl.center) + random_paths(1, n, seed=1)[0][:n]
+    xy = xy - xy.mean(0) + np.array(pl.center)
+    def run():
+        with quiet():
+            for X, Y in xy.tolist():
+                pl.move_to(X, Y)
+    return run
+
+@benchmark(2000)
+def bench_draw_vertices(n):
+    """
+    The same n vertices compiled and replayed by draw_vertices.
+    """
+    pl = make_plotter()
+    xy = np.array(random_paths(1, n, seed=1)[0][:n])
+    xy = xy - xy.mean(0) + np.array(pl.center)
+    def run():
+        with quiet():
+            pl.draw_vertices(xy)
+    return run
+
+@benchmark(100000)
+def bench_compile_vertices(n):
+    """
+    Step generation alone (step_plan), n vertices.
+    """
+    import step_plan
+    G = step_plan.Geometry()
+    rng = np.random.default_rng(2)
+    xy = np.array([G.x0, (G.y_lim[0]+G.y_lim[1])/2.]) + np.cumsum(rng.normal(0, 0.05, (n,2)), 0)
+    def run():
+        step_plan.compile_vertices(G, xy)
+    return run
+
+@benchmark(500)
+def bench_svg_to_paths(n):
+    import svg_tools
+    rng = np.random.default_rng(3)
+    tmp = scratch_dir()
+    filename = os.path.join(tmp, 'bench.svg')
+    with open(filename, 'w') as f:
+        f.write('<svg xmlns="http://www.w3.org/2000/svg"><g>\n')
+        for K in range(n):
+            x, y = rng.random(2)*500
+            d = "M {:.2f} {:.2f} ".format(x, y)
+            d += " ".join("c {:.2f} {:.2f} {:.2f} {:.2f} {:.2f} {:.2f}".format(*rng.normal(0, 5, 6))
+                          for J in range(4))
+            d += " l {:.2f} {:.2f} h 3 v 3 z".format(*rng.normal(0, 5, 2))
+            f.write('<path d="{}"/>\n'.format(d))
+        f.write('</g></svg>\n')
+    def run():
+        with quiet():
+            svg_tools.svg_to_paths(filename)
+    return run
+
+@benchmark(200)
+def bench_svg_hatch(n):
+    """
+    n filled polygons hatched in four channels by svg_to_paths.
+    """
+    import svg_tools
+    rng = np.random.default_rng(6)
+    tmp = scratch_dir()
+    filename = os.path.join(tmp, 'hatch.svg')
+    with open(filename, 'w') as f:
+        f.write('<svg xmlns="http://www.w3.org/2000/svg">\n')
+        for K in range(n):
+            t = np.sort(rng.random(30))*2*np.pi
+            r = rng.uniform(20, 60)*(0.6 + 0.4*rng.random(30))
+            xy = rng.random(2)*1000 + np.stack([r*np.cos(t), r*np.sin(t)], -1)
+            d = "M " + " L ".join("{:.2f} {:.2f}".format(*p) for p in xy) + " z"
+            f.write('<path style="fill:#{:06x}" d="{}"/>\n'.format(int(rng.integers(1<<24)), d))
+        f.write('</svg>\n')
+    def run():
+        with quiet():
+            svg_tools.svg_to_paths(filename)
+    return run
+
+@benchmark(64)
+def bench_floyd_steinberg(n):
+    """
+    n x n x 3 image, stucki kernel.
+    """
+    import lineifiers
+    img = random_image(n)
+    def run():
+        lineifiers.floyd_steinberg(img)
+    return run
+
+@benchmark(64)
+def bench_floyd_steinberg_loop(n):
+    """
+    The pixel loop floyd_steinberg replaced, same image.
+    """
+    import lineifiers
+    img = random_image(n)
+    def run():
+        lineifiers.floyd_steinberg_loop(img)
+    return run
+
+@benchmark(1000)
+def bench_resample(n):
+    """
+    n x n x 3 image, 2x oversampled.
+    """
+    import lineifiers
+    img = random_image(n)
+    def run():
+        lineifiers.resample(img, 2.)
+    return run
+
+@benchmark(1000)
+def bench_ordered_dither(n):
+    """
+    n x n x 4 cymk, tiled blue noise thresholds.
+    """
+    import lineifiers
+    cymk = lineifiers.rgb_to_cmyk(random_image(n))
+    lineifiers.blue_noise()
+    def run():
+        lineifiers.ordered_dither(cymk, 'blue')
+    return run
+
+@benchmark(256)
+def bench_raster_linify(n):
+    """
+    A dithered n x n channel.
+    """
+    import lineifiers
+    channel = (random_image(n)[:,:,0] > 127).astype(np.float64)
+    def run():
+        lineifiers.raster_linify(channel)
+    return run
+
+@benchmark(1000)
+def bench_random_dash_linify(n):
+    """
+    n x n dithered cymk.
+    """
+    import lineifiers
+    cymk = lineifiers.ordered_dither(lineifiers.rgb_to_cmyk(random_image(n)), 'bayer8')
+    def run():
+        lineifiers.random_dash_linify(cymk, random=True, seed=0)
+    return run
+
+@benchmark(1000)
+def bench_random_ngon_linify(n):
+    import lineifiers
+    cymk = lineifiers.ordered_dither(lineifiers.rgb_to_cmyk(random_image(n)), 'bayer8')
+    def run():
+        lineifiers.random_ngon_linify(cymk, seed=0)
+    return run
+
+@benchmark(1000000)
+def bench_smooth_path(n):
+    """
+    n vertex random walk, 400 vertex window.
+    """
+    import smoothing
+    path = np.cumsum(np.random.default_rng(4).normal(0, 1, (n,2)), 0)
+    def run():
+        smoothing.moving_average(path, 400)
+    return run
+
+@benchmark(1500)
+def bench_grid_lineify(n):
+    """
+    n langevin trajectories on a smooth 500 x 500 potential.
+    """
+    import lineifiers
+    from scipy import ndimage
+    img = ndimage.gaussian_filter(np.random.default_rng(5).random((500,500)), 5)*200.
+    def run():
+        lineifiers.grid_lineify(img, (0,500), (0,500), ntraj=n, max_step=1000,
+                                gamma=0.08, e0=0.03, e_thresh=0.006, m=6, seed=0)
+    return run
+
+@benchmark(5000)
+def bench_lines_to_gcode(n):
+    import laser_gcode
+    paths = random_paths(n)
+    tmp = scratch_dir()
+    def run():
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            with quiet():
+                laser_gcode.lines_to_gcode(paths)
+        finally:
+            os.chdir(cwd)
+    return run
+
+@benchmark(1)
+def bench_load_hand_pkl(n):
+    """
+    pickle.load of the bundled hand.pkl (n times).
+    """
+    filename = os.path.join(HERE, 'hand.pkl')
+    def run():
+        for K in range(n):
+            with open(filename, 'rb') as f:
+                pickle.load(f)
+    return run
+
+@benchmark(20000)
+def bench_load_pickle(n):
+    """
+    pickle.load of n synthetic paths.
+    """
+    tmp = scratch_dir()
+    filename = os.path.join(tmp, 'bench.pkl')
+    with open(filename, 'wb') as f:
+        pickle.dump(random_paths(n), f)
+    def run():
+        with open(filename, 'rb') as f:
+            pickle.load(f)
+    return run
+
+@benchmark(20000)
+def bench_load_path_file(n):
+    """
+    The same n paths as a .pgp, mapped and listed.
+    """
+    import path_file
+    tmp = scratch_dir()
+    filename = os.path.join(tmp, 'bench.pgp')
+    path_file.write_paths(filename, random_paths(n))
+    def run():
+        path_file.PathFile(filename).data()
+    return run
+
+def time_benchmark(name, scale=1., repeat=3):
+    F, size = BENCHMARKS[name]
+    size = max(1, int(size*scale))
+    times = []
+    try:
+        run = F(size)
+        for K in range(repeat):
+            t0 = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - t0)
+    finally:
+        while (len(SCRATCH)>0):
+            shutil.rmtree(SCRATCH.pop(), ignore_errors=True)
+    return {'size': size, 'best': min(times), 'mean': sum(times)/len(times),
+            'times': times}
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def run_benchmarks(names=None, scale=1., repeat=3):
+    """
+    Returns the results dict (see the module docstring).
+    """
+    if (names is None):
+        names = list(BENCHMARKS.keys())
+    results = {}
+    for name in names:
+        try:
+            results[name] = time_benchmark(name, scale, repeat)
+            print("{:24s} size {:8d} best {:10.4f}s".format(name, results[name]['size'],
+                                                             results[name]['best']), file=sys.stderr)
+        except Exception as Ex:
+            results[name] = {'error': repr(Ex)}
+            print("{:24s} failed: {}".format(name, repr(Ex)), file=sys.stderr)
+    return {'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     'revision': git_revision(),
+                     'python': platform.python_version(),
+                     'numpy': np.__version__,
+                     'machine': platform.machine(),
+                     'scale': scale, 'repeat': repeat},
+            'results': results}
+
+def compare(before, after):
+    """
+    Prints the speedup of each benchmark in two result files.
+    """
+    with open(before) as f:
+        B = json.load(f)['results']
+    with open(after) as f:
+        A = json.load(f)['results']
+    for name in B:
+        if (name in A and 'best' in B[name] and 'best' in A[name]):
+            note = "" if B[name]['size'] == A[name]['size'] else " (sizes differ)"
+            print("{:24s} {:10.4f}s => {:10.4f}s  x{:.2f}{}".format(name, B[name]['best'],
+                  A[name]['best'], B[name]['best']/max(A[name]['best'], 1e-12), note))
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark the plotting pipeline.")
+    parser.add_argument("--only", default=None, help="comma separated benchmark names")
+    parser.add_argument("--scale", type=float, default=1., help="workload size multiplier")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("-o", "--outname", default=None, help="write JSON here (else stdout)")
+    parser.add_argument("--compare", nargs=2, default=None, metavar=("BEFORE", "AFTER"))
+    parser.add_argument("--list", action="store_true")
+    args = parser.parse_args(argv)
+    if (args.list):
+        for name, (F, size) in BENCHMARKS.items():
+            print(name, size)
+        return
+    if (args.compare is not None):
+        compare(*args.compare)
+        return
+    names = None if args.only is None else args.only.split(',')
+    tore = run_benchmarks(names, args.scale, args.repeat)
+    if (args.outname is None):
+        print(json.dumps(tore, indent=1))
+    else:
+        with open(args.outname, 'w') as f:
+            json.dump(tore, f, indent=1)
+    return tore
+
+if __name__ == "__main__":
+    sys.path.insert(0, HERE)
+    main(sys.argv[1:])
@@ -0,0 +1,77 @@
+"""
+Checkpoints of a running job so it can be resumed after
+a crash, a power loss or an I2C error.
+
+A checkpoint file is append only: fixed size records of
+(time, channel, path, vertex, stepsum_L, stepsum_R, pen)
+where path and vertex index the path and vertex (in the
+un-skipped path) the pen last reached. A torn last record
+(power loss while writing) is ignored on reading.
+"""
+import os, struct, time
+
+RECORD = struct.Struct('<dqqqqqq')
+FIELDS = ('time', 'channel', 'path', 'vertex', 'stepsum_L', 'stepsum_R', 'pen')
+
+class Checkpointer:
+    def __init__(self, filename, every=5., timer=None, sync=True):
+        """
+        Args:
+            filename: the checkpoint file, appended to.
+            every: seconds between checkpoints.
+            timer: function giving the time, defaults to time.time
+            sync: fsync each record (it should survive power loss).
+        """
+        self.filename = filename
+        self.every = every
+        self.timer = time.time if timer is None else timer
+        self.sync = sync
+        self.f = None
+        self.last = None
+        self.channel = 0
+        self.path = 0
+        self.first = 0 # vertex in the path where drawing started.
+        self.written = 0
+    def open(self):
+        if (self.f is None):
+            self.f = open(self.filename, 'ab')
+        self.last = self.timer()
+        return self
+    def close(self):
+        if (self.f is not None):
+            self.f.close()
+            self.f = None
+    def write(self, vertex, stepsum_L, stepsum_R, pen):
+        """
+        Appends a record for the current channel and path.
+        """
+        if (self.f is None):
+            self.open()
+        self.last = self.timer()
+        self.f.write(RECORD.pack(self.last, self.channel, self.path, vertex,
+                                 stepsum_L, stepsum_R, pen))
+        self.f.flush()
+        if (self.sync):
+            os.fsync(self.f.fileno())
+        self.written += 1
+    def due(self):
+        """
+        True when a checkpoint should be written.
+        (One timer call, cheap enough to ask every move.)
+        """
+        return self.last is None or self.timer() - self.last >= self.every
+
+def last_checkpoint(filename):
+    """
+    The last complete record as a dict, or None.
+    """
+    if (not os.path.exists(filename)):
+        return None
+    size = os.path.getsize(filename)
+    n = size//RECORD.size
+    if (n==0):
+        return None
+    with open(filename, 'rb') as f:
+        f.seek((n-1)*RECORD.size)
+        values = RECORD.unpack(f.read(RECORD.size))
+    return dict(zip(FIELDS, values))
@@ -1,13 +1,14 @@
 from math import sqrt, pow, cos, sin, pi
-import copy, pickle, random, os
+import functools, pickle, os
 
 import numpy as np
-from scipy import interpolate
+from scipy import ndimage
 from matplotlib import pyplot as plt
 
 from PIL import Image
 import imageio
 import svgwrite
+import smoothing
 
 #
 # Idea: projection of 3d paths.
@@ -69,106 +70,129 @@ def wiggle_fill(x_dim, y_dim, nwiggle = 80, npts=400):
     return paths
 
 def smooth_path0(a_path, iters = 400):
-    path = a_path.copy()
-    for iter in range(iters):
-        new_path = [path[0]]
-        for I in range(1,len(path)-2):
-            to_app = (new_path[-1]+path[I+1])/2.
-            new_path.append(to_app)
-        new_path.append(path[-1])
-        path = np.stack(new_path,0)
-    return path
-
-def smooth_path(a_path, window = 400):
-    to_app=[a_path[0]]
-    for K in range(1,a_path.shape[0]):
-        aslice = a_path[K-window:K]
-        if len(aslice)==0:
-            to_app.append(a_path[K])
-        else:
-            to_app.append(aslice.mean(0))
-    return np.stack(to_app,0)
+    """
+    see smoothing.halving
+    """
+    return smoothing.halving(a_path, iters)
+
+def smooth_path(a_path, window = 400, method = 'mean'):
+    """
+    Trailing mean of the window vertices before each vertex,
+    or a centered 'gaussian' or 'savgol' (see smoothing.smooth)
+    """
+    return smoothing.smooth(a_path, window, method)
+
+def image_sampler(img):
+    """
+    F(a, b): img bilinearly sampled at row b*(H-1)/H, column a*(W-1)/W,
+    ie: on linspace(0,H,H) x linspace(0,W,W) grids, nearest outside.
+    (what path_channel_distort expects, it was an interp2d)
+    """
+    H, W = img.shape[:2]
+    img = np.asarray(img, dtype=np.float64)
+    def F(a, b):
+        coords = np.array([np.asarray(b, dtype=np.float64)*(H-1)/H,
+                           np.asarray(a, dtype=np.float64)*(W-1)/W])
+        return ndimage.map_coordinates(img, coords.reshape(2,-1), order=1,
+                                       mode='nearest').reshape(coords.shape[1:])
+    return F
 
 def path_channel_distort(path, F, magn=1.):
     """
-    Moves points in a path per a channel...
+    Moves points in a path per a channel,
+    each vertex by magn*(4,3)*F(vertex[1],vertex[0]).
+
+    Args:
+        path: (n,2) vertices
+        F: the channel (sampled as by image_sampler) or a function
+           like image_sampler's, called once for all the vertices.
+    Returns:
+        (n,2) array
+    """
+    path = np.asarray(path, dtype=np.float64).reshape(-1,2)
+    if (isinstance(F, np.ndarray)):
+        F = image_sampler(F)
+    z = np.asarray(F(path[:,1], path[:,0])).reshape(-1)
+    return path + magn*z[:,np.newaxis]*np.array([[4.,3.]])
+
+def resample(img, oversamp=1.0):
+    """
+    Bilinear resampling of all the channels of img by oversamp,
+    corners aligned (like the interp2d on linspace grids it replaced).
+    The last dimension is the color channel.
+    """
+    shape = (max(1, int(round(img.shape[0]*oversamp))),
+             max(1, int(round(img.shape[1]*oversamp))))
+    zoom = (shape[0]/img.shape[0], shape[1]/img.shape[1])
+    img = np.asarray(img, dtype=np.float64)
+    if (len(img.shape)==2):
+        return ndimage.zoom(img, zoom, order=1, mode='nearest', grid_mode=False)
+    # A channel at a time, 2d zooms are a lot faster.
+    tore = np.empty(shape+img.shape[2:])
+    for C in range(img.shape[2]):
+        ndimage.zoom(img[:,:,C], zoom, output=tore[:,:,C], order=1,
+                     mode='nearest', grid_mode=False)
+    return tore
+
+@functools.lru_cache(maxsize=8)
+def _read_resampled(filename, mtime, oversamp):
+    img = imageio.imread(filename)
+    if (len(img.shape)==2):
+        img = np.stack([img]*3, -1)
+    rgb = resample(img[:,:,:3], oversamp).astype(np.uint8)
+    rgb.flags.writeable = False
+    return rgb
+
+def read_resampled(f, oversamp=1.0):
+    """
+    The rgb of image file f resampled (uint8), cached
+    by file, modification time and oversamp
+    (the last few, see _read_resampled.cache_clear()).
     """
-    new_path = []
-    for vertex in path:
-        z = F(vertex[1],vertex[0])
-        new_path.append([vertex[0]+4*magn*z,vertex[1]+3*magn*z])
-    return new_path
+    return _read_resampled(os.path.abspath(f), os.path.getmtime(f), oversamp)
 
 def image_resample(f, oversamp=1.0):
     """
     The last dimension is the color channel.
     """
-    img = imageio.imread(f)
-    x = np.linspace(0,img.shape[0],img.shape[0])
-    y = np.linspace(0,img.shape[1],img.shape[1])
-    #
-    # 2x oversample the image since we'll dither it.
-    #
-    xnew = np.linspace(0, img.shape[0], img.shape[0]*oversamp)
-    ynew = np.linspace(0, img.shape[1], img.shape[1]*oversamp)
-    from scipy import interpolate
-    rc = interpolate.interp2d(x, y, img[:,:,0].flatten(), kind='linear')
-    gc = interpolate.interp2d(x, y, img[:,:,1].flatten(), kind='linear')
-    bc = interpolate.interp2d(x, y, img[:,:,2].flatten(), kind='linear')
-    rgb_new = np.stack([rc(xnew.flatten(), ynew.flatten()),
-                        gc(xnew.flatten(), ynew.flatten()),
-                        bc(xnew.flatten(), ynew.flatten())],-1).transpose(1,0,2).astype(np.uint8)
+    rgb_new = read_resampled(f, oversamp)
     plt.imshow(rgb_new)
     return rgb_new
 
-def raster_dither_image(f, r_=0.2, oversample=1.0, random=True):
+def raster_dither_image(f, r_=0.2, oversample=1.0, random=True, dither=None):
     """
     Greyscale dithers an image.
+    dither=None error diffuses the rgb (floyd_steinberg),
+    otherwise it's an ordered_dither method for the cymk.
     """
-    img = imageio.imread(f)
-    x = np.linspace(0,img.shape[0],img.shape[0])
-    y = np.linspace(0,img.shape[1],img.shape[1])
-    oversamp = oversample
-    xnew = np.linspace(0, img.shape[0], img.shape[0]*oversamp)
-    ynew = np.linspace(0, img.shape[1], img.shape[1]*oversamp)
-    rc = interpolate.interp2d(x, y, img[:,:,0].flatten(), kind='linear')
-    gc = interpolate.interp2d(x, y, img[:,:,1].flatten(), kind='linear')
-    bc = interpolate.interp2d(x, y, img[:,:,2].flatten(), kind='linear')
-    rgb_new = np.stack([rc(xnew.flatten(), ynew.flatten()),
-                        gc(xnew.flatten(), ynew.flatten()),
-                        bc(xnew.flatten(), ynew.flatten())],-1).transpose(1,0,2).astype(np.uint8)
-
+    rgb_new = read_resampled(f, oversample)
     # cymk_new = rgb_to_cymk(rgb_new)
-    dithered = floyd_steinberg(rgb_new)
-    plt.imshow((255*dithered).astype(np.uint8))
-    plt.show()
-    cymk_new = rgb_to_cmyk(dithered, RGB_SCALE=1.)
+    if (dither is None):
+        dithered = floyd_steinberg(rgb_new)
+        plt.imshow((255*dithered).astype(np.uint8))
+        plt.show()
+        cymk_new = rgb_to_cmyk(dithered, RGB_SCALE=1.)
+    else:
+        cymk_new = ordered_dither(rgb_to_cmyk(rgb_new), dither)
     k_lines = raster_linify(cymk_new[:,:,-1])
     write_svg(k_lines, "bw_lines", scale=10.)
     return k_lines
 
-def dash_dither_image(f, r_=0.2, oversample=1.0, random=True):
+def dash_dither_image(f, r_=0.2, oversample=1.0, random=True, dither=None):
     """
     Greyscale dithers an image.
+    dither=None error diffuses the rgb (floyd_steinberg),
+    otherwise it's an ordered_dither method for the cymk.
     """
-    img = imageio.imread(f)
-    x = np.linspace(0,img.shape[0],img.shape[0])
-    y = np.linspace(0,img.shape[1],img.shape[1])
-    oversamp = oversample
-    xnew = np.linspace(0, img.shape[0], img.shape[0]*oversamp)
-    ynew = np.linspace(0, img.shape[1], img.shape[1]*oversamp)
-    rc = interpolate.interp2d(x, y, img[:,:,0].flatten(), kind='linear')
-    gc = interpolate.interp2d(x, y, img[:,:,1].flatten(), kind='linear')
-    bc = interpolate.interp2d(x, y, img[:,:,2].flatten(), kind='linear')
-    rgb_new = np.stack([rc(xnew.flatten(), ynew.flatten()),
-                        gc(xnew.flatten(), ynew.flatten()),
-                        bc(xnew.flatten(), ynew.flatten())],-1).transpose(1,0,2).astype(np.uint8)
-
+    rgb_new = read_resampled(f, oversample)
     # cymk_new = rgb_to_cymk(rgb_new)
-    dithered = floyd_steinberg(rgb_new)
-    plt.imshow((255*dithered).astype(np.uint8))
-    plt.show()
-    cymk_new = rgb_to_cmyk(dithered, RGB_SCALE=1.)
+    if (dither is None):
+        dithered = floyd_steinberg(rgb_new)
+        plt.imshow((255*dithered).astype(np.uint8))
+        plt.show()
+        cymk_new = rgb_to_cmyk(dithered, RGB_SCALE=1.)
+    else:
+        cymk_new = ordered_dither(rgb_to_cmyk(rgb_new), dither)
     c_lines, y_lines, m_lines, k_lines = random_dash_linify(cymk_new, r_ = r_, random=random)
     write_svg(k_lines, "bw_lines", scale=10.)
     return k_lines
@@ -178,27 +202,82 @@ def embossed_wiggle_image(f, channel=-1, nwiggle=80):
     Reads the image file, converts to cymk.
     then does the wiggle effect on its channel.
     """
-    img = imageio.imread(f)
-    y = np.linspace(0, img.shape[0], img.shape[0])
-    x = np.linspace(0, img.shape[1], img.shape[1])
-    img = rgb_to_cmyk(img, RGB_SCALE=255.)[:,:,-1]
-    from scipy import interpolate
-    F = interpolate.interp2d(y, x, img.flatten(), kind='linear')
+    img = rgb_to_cmyk(read_resampled(f), RGB_SCALE=255.)[:,:,channel]
     sharp_wiggle = wiggle_fill((0,img.shape[1]), (0,img.shape[0]), nwiggle=nwiggle)
     list_wiggle=np.array(sharp_wiggle).reshape(-1,2)
     wiggle = smooth_path(list_wiggle)
-    new_path = smooth_path(np.array(path_channel_distort(wiggle, F)).reshape(-1,2),window=4)
+    new_path = smooth_path(path_channel_distort(wiggle, img), window=4)
     P = np.array(new_path).reshape(-1,2)*np.array([[1.,-1.]])
     plt.plot(P[:,0],-1*P[:,1])
     # plt.plot(P[:,1]-P[:,1].min(),-1*P[:,0]+P[:,0].max())
     plt.show()
     return [P.tolist()]
 
+# Error diffusion kernels. Row 0 is the current scan line
+# (the pixel is at column 2), rows 1 and 2 the next two.
+DIFFUSION_KERNELS = {
+    'floyd': np.array([[0.,0.,0,7,0],[0.,3.,5,1,0],[0.,0.,0,0,0]])/16.,
+    'stucki': np.array([[0.,0.,0,8,4],[2.,4.,8,4,2],[1.,2.,4,2,1]])/42.,
+    'atkinson': np.array([[0.,0.,0,1,1],[0.,1.,1,1,0],[0.,0.,1,0,0]])/8.,
+    'jarvis': np.array([[0.,0.,0,7,5],[3.,5.,7,5,3],[1.,3.,5,3,1]])/48.,
+}
+
 def floyd_steinberg(X, mx=255., alg = 'stucki'):
     """
     can take the output of image_resample_and_rgb
     output is 1 or zero.
+
+    Error diffusion with alg one of DIFFUSION_KERNELS
+    (anything else is atkinson, as it always was).
+    The scan goes along axis 0 one axis 1 line at a time,
+    like floyd_steinberg_loop, and gives bit-identical output.
+    Pixels can't be done a line at a time since each one needs
+    the error of the two before it, but pixel (x,y) only needs
+    pixels with a smaller x + 5y, so all pixels on a diagonal
+    x + 5y = t are done at once. That order also adds the errors
+    into every pixel in the same order the loop does.
+    Zero weights are skipped, which doesn't change any sum.
     """
+    error_array = DIFFUSION_KERNELS.get(alg, DIFFUSION_KERNELS['atkinson'])
+    rank = len(X.shape)
+    if (rank==2):
+        out = np.zeros((X.shape[0]+4, X.shape[1]+4))
+    elif (rank==3):
+        out = np.zeros((X.shape[0]+4, X.shape[1]+4, X.shape[2]))
+    errors = np.zeros(out.shape)
+    xdim = X.shape[0]
+    ydim = X.shape[1]
+    # Flat views, in which a diagonal is a strided slice.
+    Xp = np.zeros(out.shape)
+    Xp[2:-2,2:-2] = X.astype(np.float64)/mx
+    Wp = ydim+4
+    S = 5*Wp-1
+    Xf = Xp.reshape((-1,)+out.shape[2:])
+    Ef = errors.reshape(Xf.shape)
+    Of = out.reshape(Xf.shape)
+    taps = [((dx-2)*Wp+dy, error_array[dy,dx]) for dy in range(3) for dx in range(5)
+            if error_array[dy,dx] != 0.]
+    for t in range(xdim + 5*(ydim-1)):
+        y0 = max(0, -((xdim-1-t)//5))
+        y1 = min(ydim-1, t//5)
+        if (y0 > y1):
+            continue
+        lo = (t+2)*Wp + 2 - y1*S
+        hi = (t+2)*Wp + 3 - y0*S
+        div = Xf[lo:hi:S] + Ef[lo:hi:S]
+        output = np.round(div)
+        error = div - output
+        Of[lo:hi:S] = output
+        for off, w in taps:
+            Ef[lo+off:hi+off:S] += error*w
+    return out[2:-2,2:-2]
+
+def floyd_steinberg_loop(X, mx=255., alg = 'stucki'):
+    """
+    The original pixel by pixel floyd_steinberg.
+    Kept as the reference (and benchmark) for floyd_steinberg.
+    """
+    error_array = DIFFUSION_KERNELS.get(alg, DIFFUSION_KERNELS['atkinson'])
     rank = len(X.shape)
     if (rank==2):
         out = np.zeros((X.shape[0]+4, X.shape[1]+4))
@@ -207,10 +286,6 @@ def floyd_steinberg(X, mx=255., alg = 'stucki'):
     errors = np.zeros(out.shape)
     xdim = X.shape[0]
     ydim = X.shape[1]
-    if (alg == 'stucki'):
-        error_array = np.array([[0.,0.,0,8,4],[2.,4.,8,4,2],[1.,2.,4,2,1]])/42.
-    else:
-        error_array = np.array([[0.,0.,0,1,1],[0.,1.,1,1,0],[0.,0.,1,0,0]])/8.
     for y in range(2,ydim+2):
         for x in range(2,xdim+2):
             div = X[x-2,y-2].astype(np.float64)/mx + errors[x,y]
@@ -223,6 +298,90 @@ def floyd_steinberg(X, mx=255., alg = 'stucki'):
                 errors[x-2:x+3,y:y+3] += error * error_array[:,:,np.newaxis].transpose(1,0,2)
     return out[2:-2,2:-2]
 
+def bayer_matrix(n=8):
+    """
+    The n x n (n a power of 2) Bayer threshold map in (0,1).
+    """
+    M = np.zeros((1,1))
+    while (M.shape[0] < n):
+        M = np.block([[4*M, 4*M+2], [4*M+3, 4*M+1]])
+    return (M+0.5)/M.size
+
+_BLUE_NOISE = {}
+def blue_noise(n=64, sigma=1.5, seed=0):
+    """
+    An n x n tileable blue noise threshold map in (0,1)
+    made by void-and-cluster (Ulichney 1993). Cached.
+    """
+    key = (n, sigma, seed)
+    if (key in _BLUE_NOISE):
+        return _BLUE_NOISE[key]
+    # Gaussian on the torus, centered on (0,0).
+    d = np.minimum(np.arange(n), n-np.arange(n))
+    G = np.exp(-(d[:,np.newaxis]**2 + d[np.newaxis,:]**2)/(2.*sigma*sigma))
+    def splat(E, K, sign):
+        E += sign*np.roll(np.roll(G, K//n, 0), K%n, 1).ravel()
+    rng = np.random.default_rng(seed)
+    B = np.zeros(n*n, dtype=bool)
+    B[rng.choice(n*n, max(1, n*n//10), replace=False)] = True
+    E = np.zeros(n*n)
+    for K in np.flatnonzero(B):
+        splat(E, K, 1.)
+    # Move the tightest cluster into the largest void until stable.
+    while True:
+        cluster = np.argmax(np.where(B, E, -np.inf))
+        B[cluster] = False
+        splat(E, cluster, -1.)
+        void = np.argmin(np.where(B, np.inf, E))
+        B[void] = True
+        splat(E, void, 1.)
+        if (void == cluster):
+            break
+    rank = np.zeros(n*n)
+    ones = int(B.sum())
+    # Rank the initial points by removing clusters...
+    B1, E1 = B.copy(), E.copy()
+    for R in range(ones-1, -1, -1):
+        cluster = np.argmax(np.where(B1, E1, -np.inf))
+        B1[cluster] = False
+        splat(E1, cluster, -1.)
+        rank[cluster] = R
+    # ...and the rest by filling voids.
+    for R in range(ones, n*n):
+        void = np.argmin(np.where(B, np.inf, E))
+        B[void] = True
+        splat(E, void, 1.)
+        rank[void] = R
+    _BLUE_NOISE[key] = ((rank+0.5)/(n*n)).reshape(n,n)
+    return _BLUE_NOISE[key]
+
+def threshold_map(method='bayer8'):
+    """
+    'bayer2', 'bayer4', 'bayer8', 'bayer16'... or 'blue' ('blue32' etc. for size)
+    """
+    if (method.startswith('bayer')):
+        return bayer_matrix(int(method[5:] or 8))
+    if (method.startswith('blue')):
+        return blue_noise(int(method[4:] or 64))
+    raise Exception("Unknown dither: "+method)
+
+def ordered_dither(X, method='bayer8'):
+    """
+    Ordered dithering, one comparison of the whole image
+    against a tiled threshold map (see threshold_map).
+
+    Args:
+        X: (x,y) or (x,y,channels) image in [0,1] ie: from rgb_to_cmyk
+    Returns:
+        1. or 0. like floyd_steinberg.
+    """
+    T = threshold_map(method) if isinstance(method, str) else np.asarray(method)
+    reps = (-(-X.shape[0]//T.shape[0]), -(-X.shape[1]//T.shape[1]))
+    T = np.tile(T, reps)[:X.shape[0],:X.shape[1]]
+    if (len(X.shape)==3):
+        T = T[:,:,np.newaxis]
+    return (X > T).astype(np.float64)
+
 def rgb_to_cmyk(X, RGB_SCALE = 255):
     """
     Args:
@@ -271,98 +430,86 @@ def dist(X,Y):
 
 def raster_linify(channel):
     """
-    Draws ngons over a previously dithered image.
-    """
-    k_lines = []
-    right = True
-    for X in range(channel.shape[0]):
-        linestart = None
-        inline = False
-        if right == True:
-            Y=0
-            while (Y < channel.shape[1]):
-                if (inline):
-                    if (channel[X,Y]>0.5):
-                        pass
-                    else:
-                        k_lines.append(copy.copy([linestart,[X,Y]]))
-                        inline = False
-                else:
-                    if (channel[X,Y]>0.5):
-                        linestart = copy.copy([X,Y])
-                        inline=True
-                    else:
-                        pass
-                Y=Y+1
-            right = False
+    Horizontal lines over the runs of set pixels of a previously
+    dithered image, in boustrophedon order (even rows left to right,
+    odd rows right to left). A run's end is the first unset pixel
+    past it (or the pixel past the edge).
+
+    Args:
+        channel: (x,y) dithered channel, or (x,y,channels)
+    Returns:
+        (n,2,2) array of [[X,Y_start],[X,Y_end]]
+        (a list of them for each channel if given several)
+    """
+    if (len(channel.shape)==3):
+        return [raster_linify(channel[:,:,C]) for C in range(channel.shape[2])]
+    on = np.zeros((channel.shape[0], channel.shape[1]+2), dtype=np.int8)
+    on[:,1:-1] = channel > 0.5
+    X, Y0 = np.nonzero(np.diff(on, axis=1) == 1)
+    Y1 = np.nonzero(np.diff(on, axis=1) == -1)[1]
+    # Runs are found left to right, starts and ends pair up in order.
+    left = (X % 2) == 1
+    order = np.lexsort((np.where(left, -Y0, Y0), X))
+    X, Y0, Y1, left = X[order], Y0[order], Y1[order], left[order]
+    tore = np.empty((len(X),2,2))
+    tore[:,:,0] = X[:,np.newaxis]
+    tore[:,0,1] = np.where(left, Y1-1, Y0)
+    tore[:,1,1] = np.where(left, Y0-1, Y1)
+    return tore
+
+def random_dash_linify(cymk_img, r_ = 0.2, random=False, seed=None):
+    """
+    Draws a dash at each set pixel of a previously dithered image.
+
+    Args:
+        random: random dash angles, else vertical dashes.
+        seed: of the np.random.Generator (None is unseeded)
+    Returns:
+        c,y,m,k (n,2,2) arrays of [[X,Y],[X,Y]+r_*(cos,sin)]
+    """
+    rng = np.random.default_rng(seed)
+    tore = []
+    for C in range(4):
+        X, Y = np.nonzero(cymk_img[:,:,C]>0.5)
+        if (random):
+            phase = rng.random(len(X))*2*pi
         else:
-            Y=channel.shape[1]-1
-            while (Y > 0):
-                if (inline):
-                    if (channel[X,Y]>0.5):
-                        pass
-                    else:
-                        k_lines.append(copy.copy([linestart,[X,Y]]))
-                        inline = False
-                else:
-                    if (channel[X,Y]>0.5):
-                        linestart = copy.copy([X,Y])
-                        inline=True
-                    else:
-                        pass
-                Y=Y-1
-            right = True
-    return k_lines
+            phase = np.full(len(X), 3.1415/2)
+        lines = np.empty((len(X),2,2))
+        lines[:,0,0], lines[:,0,1] = X, Y
+        lines[:,1,0] = X + r_*np.cos(phase)
+        lines[:,1,1] = Y + r_*np.sin(phase)
+        tore.append(lines)
+    return tuple(tore)
 
-def random_dash_linify(cymk_img, r_ = 0.2, random=False):
+def random_ngon_linify(cymk_img, n_min=3, n_max=6, r_min = .1, r_max = 1., seed=None):
     """
-    Draws ngons over a previously dithered image.
+    Draws a random ngon (n_min to n_max sides) at each
+    set pixel of a previously dithered image.
+    The ngons are closed, like ngon() (closed=True) always
+    made them: a k-gon is k+1 vertices ending at the first.
+
+    Args:
+        seed: of the np.random.Generator (None is unseeded)
+    Returns:
+        c,y,m,k (n,n_max+1,2) arrays of vertices. Unlike the
+        lists of ngon() this used to return, ngons with fewer
+        than n_max sides are padded to n_max+1 vertices by
+        repeating their first (and last) vertex, which only
+        adds zero length moves.
     """
-    c_lines, y_lines, m_lines, k_lines = [],[],[],[]
-    for X in range(cymk_img.shape[0]):
-        for Y in range(cymk_img.shape[1]):
-            if (random):
-                phase = random.random()*2*pi
-            else:
-                phase = 3.1415/2
-            if (cymk_img[X,Y,0]>0.5):
-                c_lines.append(dash(X, Y, r=r_, phase=phase))
-            if (cymk_img[X,Y,1]>0.5):
-                y_lines.append(dash(X, Y, r=r_, phase=phase))
-            if (cymk_img[X,Y,2]>0.5):
-                m_lines.append(dash(X, Y, r=r_, phase=phase))
-            if (cymk_img[X,Y,3]>0.5):
-                k_lines.append(dash(X, Y, r=r_, phase=phase))
-    return c_lines, y_lines, m_lines, k_lines
-
-def random_ngon_linify(cymk_img, n_min=3, n_max=6, r_min = .1, r_max = 1.):
-    """
-    Draws ngons over a previously dithered image.
-    """
-    c_lines, y_lines, m_lines, k_lines = [],[],[],[]
-    for X in range(cymk_img.shape[0]):
-        for Y in range(cymk_img.shape[1]):
-            if (cymk_img[X,Y,0]>0.5):
-                R = random.random()*(r_max-r_min) + r_min
-                NN = random.randint(n_min,n_max)
-                phase = random.random()*2*pi
-                c_lines.append(ngon(X,Y,r=R,n=NN,phase=phase))
-            if (cymk_img[X,Y,1]>0.5):
-                R = random.random()*(r_max-r_min) + r_min
-                NN = random.randint(n_min,n_max)
-                phase = random.random()*2*pi
-                y_lines.append(ngon(X,Y,r=R,n=NN,phase=phase))
-            if (cymk_img[X,Y,2]>0.5):
-                R = random.random()*(r_max-r_min) + r_min
-                NN = random.randint(n_min,n_max)
-                phase = random.random()*2*pi
-                m_lines.append(ngon(X,Y,r=R,n=NN,phase=phase))
-            if (cymk_img[X,Y,3]>0.5):
-                R = random.random()*(r_max-r_min) + r_min
-                NN = random.randint(n_min,n_max)
-                phase = random.random()*2*pi
-                k_lines.append(ngon(X,Y,r=R,n=NN,phase=phase))
-    return c_lines, y_lines, m_lines, k_lines
+    rng = np.random.default_rng(seed)
+    J = np.arange(n_max+1)
+    tore = []
+    for C in range(4):
+        X, Y = np.nonzero(cymk_img[:,:,C]>0.5)
+        R = rng.random(len(X))*(r_max-r_min) + r_min
+        NN = rng.integers(n_min, n_max+1, len(X))
+        phase = rng.random(len(X))*2*pi
+        angle = np.minimum(J[np.newaxis,:], NN[:,np.newaxis])*(2*pi/NN[:,np.newaxis]) + phase[:,np.newaxis]
+        tore.append(np.stack([X[:,np.newaxis] + R[:,np.newaxis]*np.cos(angle),
+                              Y[:,np.newaxis] + R[:,np.newaxis]*np.sin(angle)], -1))
+    return tuple(tore)
 
 def write_svg(lines, outname="dump", scale = 1.0):
     dwg = svgwrite.Drawing(outname+'.svg')
@@ -405,66 +552,118 @@ def cymk_to_svg(lines, outname="dump", scale = 1.0):
                              stroke=svgwrite.rgb(0, 0, 0, '%')))
     dwg.save()
 
+def langevin_trajectories(f, starts, max_step = 3000, gamma = 0.02, dt = 9.,
+                          e0 = 0.1, e_thresh = 0.001, h = 2e-1, m = 3,
+                          bounce = False, x_lim=(0.,256), y_lim=(0.,256), seed = None):
+    """
+    Integrates all the trajectories of grid_lineify together,
+    velocity verlet with langevin noise in the potential f.
+    Live trajectories are masked, they die when absorbed
+    (randomly where f is large, or at an edge unless bounce)
+    slow (speed < e_thresh) or after max_step steps.
+
+    Args:
+        f: potential taking arrays, f(x, y) elementwise
+           (ie: image_sampler(channel)) or the channel itself.
+        starts: (n,2) start points.
+        seed: of the np.random.Generator (or a Generator)
+    Returns:
+        list of n (k,2) arrays, the points after each step.
+    """
+    if (isinstance(f, np.ndarray)):
+        f = image_sampler(f)
+    rng = np.random.default_rng(seed)
+    lo = np.array([x_lim[0], y_lim[0]], dtype=np.float64)
+    hi = np.array([x_lim[1], y_lim[1]], dtype=np.float64)
+    offsets = np.array([[0.,0.],[h,0.],[-h,0.],[0.,h],[0.,-h]])
+    def potential(X):
+        # PE and its central difference gradient, one call of f.
+        P = (X[np.newaxis,:,:] + offsets[:,np.newaxis,:]).reshape(-1,2)
+        F = np.asarray(f(P[:,0], P[:,1]), dtype=np.float64).reshape(5,-1)
+        return F[0], np.stack([F[1]-F[2], F[3]-F[4]], -1)/(2*h)
+    n = len(starts)
+    X = np.array(starts, dtype=np.float64).reshape(-1,2)
+    V = rng.normal(0, np.sqrt(e0/m), (n,2))
+    PE, G = potential(X)
+    sigma = np.sqrt(gamma*e0)
+    alive = np.ones(n, dtype=bool)
+    points, owners = [], []
+    for step in range(max_step):
+        alive &= np.sqrt((V*V).sum(-1)) > e_thresh
+        idx = np.flatnonzero(alive)
+        # Absorbed at random where the potential is high.
+        absorbed = np.exp(-PE[idx]/.01) > rng.random(len(idx))
+        alive[idx[absorbed]] = False
+        idx = idx[~absorbed]
+        if (len(idx)==0):
+            break
+        x, v = X[idx], V[idx]
+        v += 0.5*dt*(G[idx] - gamma*v + rng.normal(0, sigma, v.shape))/m
+        x += v*dt
+        if (bounce):
+            over = x > hi
+            x[over] -= 2.0*np.abs(x-hi)[over]
+            v[over] *= -1
+            under = x < lo
+            x[under] += 2.0*np.abs(x-lo)[under]
+            v[under] *= -1
+        else: # absorb
+            inside = ((x >= lo) & (x <= hi)).all(-1)
+            alive[idx[~inside]] = False
+            idx, x, v = idx[inside], x[inside], v[inside]
+        points.append(x)
+        owners.append(idx)
+        PE[idx], G[idx] = potential(x)
+        v += 0.5*dt*(G[idx] - gamma*v + rng.normal(0, sigma, v.shape))/m
+        X[idx], V[idx] = x, v
+    if (len(points)==0):
+        return [np.zeros((0,2)) for K in range(n)]
+    points = np.concatenate(points, 0)
+    owners = np.concatenate(owners, 0)
+    # Steps are in order, a stable sort groups them by trajectory.
+    order = np.argsort(owners, kind='stable')
+    counts = np.bincount(owners, minlength=n)
+    return np.split(points[order], np.cumsum(counts)[:-1])
+
+def _langevin_batch(args):
+    f, starts, kwargs = args
+    return langevin_trajectories(f, starts, **kwargs)
+
 def grid_lineify(f, x_lim=(0.,256) ,y_lim=(0.,256), ntraj = 600,
             max_step = 3000, gamma = 0.02, dt = 9., e0 = 0.1,
             T = 0.1,
-            e_thresh = 0.001, h = 2e-1, m = 3, bounce = False
+            e_thresh = 0.001, h = 2e-1, m = 3, bounce = False,
+            seed = None, processes = None, batch = 512
            ):
     """
     Units here are going to be pixel/sec.
+    Langevin trajectories from a grid of ntraj starts,
+    integrated batch trajectories at a time (see langevin_trajectories).
+
+    Args:
+        f: potential f(x, y) evaluated on arrays, ie: for a channel
+           image_sampler(channel), or the channel itself.
+           (an interp2d(x, y, channel) was image_sampler(channel))
+        seed: each batch gets its own generator spawned from it,
+           so a seed gives the same lines for any processes.
+        processes: run the batches over this many
+           processes (f has to pickle, a channel does).
+    Returns:
+        list of (k,2) arrays
     """
-    lines = []
     nx = int(np.sqrt(ntraj))
     x_starts, y_starts = np.meshgrid(np.linspace(x_lim[0],x_lim[1],nx),
                                      np.linspace(y_lim[0],y_lim[1],nx))
-    x_starts = x_starts.flatten()
-    y_starts = y_starts.flatten()
-    for traj in range(len(x_starts)):
-        x,y = x_starts[traj].item(), y_starts[traj].item()
-        PE = f(x, y)
-        v0 = np.sqrt(e0/m)
-        vx,vy = np.random.normal(0,v0), np.random.normal(0,v0)
-        line = []
-        step = 0
-        while step < max_step and np.sqrt(vx*vx+vy*vy) > e_thresh:
-            PE = f(x, y)
-            if (np.exp(-PE/.01) > np.random.random()):
-                break
-            # cdiff grad
-            gx = ((f(x+h,y)-f(x-h,y))/(2*h)).item()
-            gy = ((f(x,y+h)-f(x,y-h))/(2*h)).item()
-            vx += 0.5*dt*(gx - gamma*vx + np.random.normal(0,np.sqrt(gamma*e0))  )/m
-            vy += 0.5*dt*(gy - gamma*vy + np.random.normal(0,np.sqrt(gamma*e0))  )/m
-            x += vx*dt
-            y += vy*dt
-            # Bounce off edges.
-            if (bounce):
-                if (x > x_lim[1]):
-                    x -= 2.0*np.abs(x-x_lim[1])
-                    vx *= -1
-                if (x < x_lim[0]):
-                    x += 2.0*np.abs(x-x_lim[0])
-                    vx *= -1
-                if (y > y_lim[1]):
-                    y -= 2.0*np.abs(y-y_lim[1])
-                    vy *= -1
-                if (y < y_lim[0]):
-                    y += 2.0*np.abs(y-y_lim[0])
-                    vy *= -1
-            else: # absorb
-                if (x > x_lim[1]):
-                    break
-                elif (x < x_lim[0]):
-                    break
-                elif (y > y_lim[1]):
-                    break
-                elif (y < y_lim[0]):
-                    break
-            line.append([x,y])
-            gx = ((f(x+h,y)-f(x-h,y))/(2*h)).item()
-            gy = ((f(x,y+h)-f(x,y-h))/(2*h)).item()
-            vx += 0.5*dt*(gx - gamma*vx + np.random.normal(0,np.sqrt(gamma*e0))  )/m
-            vy += 0.5*dt*(gy - gamma*vy + np.random.normal(0,np.sqrt(gamma*e0))  )/m
-            step += 1
-        lines.append(line)
-    return lines
+    starts = np.stack([x_starts.flatten(), y_starts.flatten()], -1)
+    kwargs = dict(max_step=max_step, gamma=gamma, dt=dt, e0=e0, e_thresh=e_thresh,
+                  h=h, m=m, bounce=bounce, x_lim=x_lim, y_lim=y_lim)
+    n_batches = max(1, -(-len(starts)//batch))
+    seeds = np.random.SeedSequence(seed).spawn(n_batches)
+    jobs = [(f, S, dict(kwargs, seed=np.random.default_rng(Q)))
+            for S, Q in zip(np.array_split(starts, n_batches), seeds)]
+    if (processes is None or processes < 2):
+        results = map(_langevin_batch, jobs)
+        return [line for lines in results for line in lines]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(processes) as pool:
+        return [line for lines in pool.map(_langevin_batch, jobs) for line in lines]
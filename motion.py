@@ -0,0 +1,103 @@
+"""
+Acceleration aware step timing.
+
+The steppers used to sleep a fixed JStepper.step_delay after
+every step. MotionPlanner instead looks ahead over all the
+vertices of a path and gives every compiled step its own delay
+from a trapezoidal velocity profile, so long straight runs go
+fast and corners and stops stay slow enough not to skip steps.
+"""
+import numpy as np
+
+class MotionPlanner:
+    def __init__(self, max_speed=1.5, accel=3.0,
+                 junction_deviation=0.01,
+                 min_delay=0.005, max_delay=0.05):
+        """
+        Units are cm and seconds.
+
+        Args:
+            max_speed: cruise speed of the pen.
+            accel: acceleration used to ramp speed up and down.
+            junction_deviation: how far the pen may cut a corner
+                (as in grbl). Bigger means faster corners.
+            min_delay: the fastest step the hardware can take.
+            max_delay: the slowest step, ie: the old fixed step_delay.
+        """
+        self.max_speed = max_speed
+        self.accel = accel
+        self.junction_deviation = junction_deviation
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+    def junction_speeds(self, units):
+        """
+        Max speed through the vertex between consecutive
+        unit vectors, by the junction deviation rule.
+        """
+        cos_theta = -(units[:-1]*units[1:]).sum(-1)
+        sin_half = np.sqrt(np.clip(0.5*(1.-cos_theta), 0., 1.))
+        with np.errstate(divide='ignore'):
+            v2 = self.accel*self.junction_deviation*sin_half/(1.-sin_half)
+        return np.sqrt(np.minimum(v2, self.max_speed*self.max_speed))
+    def entry_speeds(self, lengths, units, stops=None):
+        """
+        Entry speed of each segment (and the final exit speed)
+        starting and ending at rest.
+        stops optionally marks segments which start at rest too.
+
+        The backward pass (we must be able to stop at the end)
+        v[K] = min(v[K], sqrt(v[K+1]^2 + 2a*lengths[K])) and the
+        forward pass (we can only speed up so fast) are running
+        minimums of v^2 -/+ 2a*distance, so no python loop.
+        """
+        m = len(lengths)
+        v2 = np.zeros(m+1)
+        v2[1:m] = self.junction_speeds(units)**2
+        if (stops is not None):
+            v2[:m][stops] = 0.
+        two_a = 2.*self.accel
+        # Distance to the start of each segment.
+        C = two_a*np.concatenate([[0.], np.cumsum(lengths)])
+        # Backward pass.
+        v2[1:m] = np.minimum.accumulate((v2+C)[::-1])[::-1][1:m] - C[1:m]
+        # Forward pass.
+        v2[1:m] = np.minimum.accumulate(v2[:m]-C[:m])[1:m] + C[1:m]
+        return np.sqrt(np.maximum(v2, 0.))
+    def __call__(self, start, xy, counts, stops=None):
+        """
+        Args:
+            start: xy where the move starts.
+            xy: (m,2) vertices moved through.
+            counts: (m,) number of step events of each move.
+            stops: optional (m,) bool, moves which start at rest
+                (ie: the pen lifts), so many paths are planned at once.
+        Returns:
+            (sum(counts),) per step delays in seconds.
+        """
+        counts = np.asarray(counts, dtype=np.int64)
+        xy = np.asarray(xy, dtype=np.float64).reshape(-1,2)
+        delays = np.full(counts.sum(), self.max_delay)
+        moving = counts>0
+        if (not moving.any()):
+            return delays
+        pts = np.concatenate([np.asarray(start, dtype=np.float64).reshape(1,2), xy], 0)
+        vecs = (pts[1:]-pts[:-1])[moving]
+        n = counts[moving]
+        lengths = np.sqrt((vecs*vecs).sum(-1))
+        units = vecs/np.maximum(lengths, 1e-12)[:,np.newaxis]
+        if (stops is not None):
+            # A stop before moves without steps holds for the next move.
+            S = np.cumsum(np.asarray(stops, dtype=np.int64))[moving]
+            stops = np.diff(np.concatenate([[0], S])) > 0
+        v = self.entry_speeds(lengths, units, stops)
+        # Distance along each segment at the middle of each step.
+        seg = np.repeat(np.arange(len(n)), n)
+        j = np.arange(len(seg)) - np.repeat(np.cumsum(n)-n, n)
+        ds = lengths[seg]/n[seg]
+        s = (j+0.5)*ds
+        v_step = np.minimum(np.sqrt(v[seg]**2 + 2.*self.accel*s),
+                            np.sqrt(v[seg+1]**2 + 2.*self.accel*(lengths[seg]-s)))
+        v_step = np.minimum(v_step, self.max_speed)
+        dt = np.where(v_step > 0, ds/np.maximum(v_step, 1e-12), self.max_delay)
+        delays[:] = np.clip(dt, self.min_delay, self.max_delay)
+        return delays
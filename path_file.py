@@ -0,0 +1,148 @@
+"""
+A compact binary path file (.pgp) which loads in constant
+time by memory mapping, instead of unpickling nested lists.
+
+Layout (little endian):
+    header: magic b'PGPATH1\0', uint32 version, uint32 n_channels,
+            int64 n_paths, int64 n_vertices,
+            float64 xmin, ymin, xmax, ymax (bounds of all paths)
+    int64 channel_offsets[n_channels+1] (into the paths)
+    int64 path_offsets[n_paths+1] (into the vertices)
+    float32 vertices[n_vertices, 2]
+
+A mono file has 1 channel, a CYMK file 4.
+Paths with fewer than 2 vertices are dropped, like the plotter does.
+
+usage: python3 path_file.py job.pkl [more.pkl ...]
+writes job.pgp etc.
+"""
+import pickle, struct, sys
+import numpy as np
+
+MAGIC = b'PGPATH1\0'
+VERSION = 1
+HEADER = struct.Struct('<8sIIqq4d')
+
+def is_cymk(data):
+    """
+    CYMK data is 4 channels of paths of vertices.
+    """
+    if (len(data)!=4):
+        return False
+    for channel in data:
+        for path in channel:
+            if (len(path)==0):
+                continue
+            return np.ndim(path[0])==1
+    return False
+
+def write_paths(filename, data, cymk=None):
+    """
+    Writes mono paths or [c_paths, y_paths, m_paths, k_paths].
+    Raises if there is nothing to draw.
+    """
+    if (cymk is None):
+        cymk = is_cymk(data)
+    channels = data if cymk else [data]
+    channel_offsets = [0]
+    lengths = []
+    arrays = []
+    for channel in channels:
+        for path in channel:
+            if (len(path)<2):
+                continue
+            A = np.asarray(path, dtype=np.float32).reshape(-1,2)
+            arrays.append(A)
+            lengths.append(len(A))
+        channel_offsets.append(len(arrays))
+    if (len(arrays)==0):
+        raise Exception("No paths (of 2 or more vertices) to write to "+filename)
+    path_offsets = np.zeros(len(lengths)+1, dtype=np.int64)
+    path_offsets[1:] = np.cumsum(lengths)
+    vertices = np.concatenate(arrays, 0)
+    bounds = vertices.min(0).tolist() + vertices.max(0).tolist()
+    with open(filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(channels), len(lengths),
+                            len(vertices), *bounds))
+        f.write(np.array(channel_offsets, dtype='<i8').tobytes())
+        f.write(path_offsets.astype('<i8').tobytes())
+        f.write(vertices.astype('<f4').tobytes())
+    return filename
+
+def convert_pickle(filename, outname=None):
+    """
+    Converts a pickled path list (mono or CYMK) into a .pgp file.
+    """
+    with open(filename,'rb') as f:
+        DATA = pickle.load(f)
+    if (outname is None):
+        outname = filename.rsplit('.',1)[0]+'.pgp'
+    return write_paths(outname, DATA)
+
+def is_path_file(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+class PathFile:
+    def __init__(self, filename):
+        """
+        Memory maps a .pgp file. Nothing is read
+        but the header until paths are asked for.
+        """
+        with open(filename, 'rb') as f:
+            head = f.read(HEADER.size)
+        magic, version, n_channels, n_paths, n_vertices, *bounds = HEADER.unpack(head)
+        if (magic != MAGIC):
+            raise Exception("Not a path file: "+filename)
+        if (version != VERSION):
+            raise Exception("Unknown path file version {}".format(version))
+        self.filename = filename
+        self.n_channels = n_channels
+        self.n_paths = n_paths
+        self.n_vertices = n_vertices
+        self.bounds = bounds
+        offset = HEADER.size
+        self.channel_offsets = np.memmap(filename, dtype='<i8', mode='r',
+                                         offset=offset, shape=(n_channels+1,))
+        offset += 8*(n_channels+1)
+        self.path_offsets = np.memmap(filename, dtype='<i8', mode='r',
+                                      offset=offset, shape=(n_paths+1,))
+        offset += 8*(n_paths+1)
+        if (n_vertices>0):
+            self.vertices = np.memmap(filename, dtype='<f4', mode='r',
+                                      offset=offset, shape=(n_vertices,2))
+        else:
+            self.vertices = np.zeros((0,2), dtype=np.float32)
+    @property
+    def cymk(self):
+        return self.n_channels==4
+    def path(self, K):
+        """
+        The K-th path as a (n,2) float32 view.
+        """
+        return self.vertices[self.path_offsets[K]:self.path_offsets[K+1]]
+    def channel_len(self, channel=0):
+        return int(self.channel_offsets[channel+1]-self.channel_offsets[channel])
+    def iter_paths(self, channel=0):
+        """
+        Yields the paths of a channel one at a time.
+        """
+        for K in range(self.channel_offsets[channel], self.channel_offsets[channel+1]):
+            yield self.path(K)
+    def channel(self, channel=0):
+        """
+        List of the paths (views) of a channel.
+        """
+        return list(self.iter_paths(channel))
+    def data(self):
+        """
+        The paths in the plotter's usual layout:
+        paths for mono, [c_paths, y_paths, m_paths, k_paths] for CYMK.
+        """
+        if (self.cymk):
+            return [self.channel(C) for C in range(4)]
+        return self.channel(0)
+
+if __name__ == "__main__":
+    for name in sys.argv[1:]:
+        print(name, "=>", convert_pickle(name))
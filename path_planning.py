@@ -0,0 +1,269 @@
+"""
+Path level planning: ordering and joining the paths
+of a job to cut pen lifts and pen-up travel.
+
+These work on lists of paths (lists of [x,y] vertices)
+like the rest of the plotter, and are cheap enough to run
+on the pi, although the desktop is still the better place.
+"""
+import numpy as np
+
+def path_ends(paths):
+    """
+    (n,2) start and (n,2) end points of paths.
+    """
+    starts = np.array([p[0] for p in paths], dtype=np.float64).reshape(-1,2)
+    ends = np.array([p[-1] for p in paths], dtype=np.float64).reshape(-1,2)
+    return starts, ends
+
+def travel_distance(paths, start=None):
+    """
+    Total pen-up travel drawing paths in order
+    (from start, if given, to the first path).
+    """
+    paths = [p for p in paths if len(p)>=2]
+    if (len(paths)==0):
+        return 0.
+    starts, ends = path_ends(paths)
+    gaps = starts[1:] - ends[:-1]
+    travel = np.sqrt((gaps*gaps).sum(-1)).sum()
+    if (start is not None):
+        travel += np.sqrt(np.power(starts[0]-np.asarray(start), 2.0).sum())
+    return float(travel)
+
+def join_paths(paths, tol=0.05):
+    """
+    Merges consecutive paths where one ends within tol of
+    where the next starts, so the pen can stay down across
+    the join. (It draws the short gap.)
+
+    Returns:
+        the joined paths, number of pen lifts saved.
+    """
+    paths = [p for p in paths if len(p)>=2]
+    if (len(paths)<2):
+        return paths, 0
+    starts, ends = path_ends(paths)
+    gaps = starts[1:] - ends[:-1]
+    join = np.sqrt((gaps*gaps).sum(-1)) <= tol
+    if (not join.any()):
+        return paths, 0
+    tore = [list(paths[0])]
+    for path, joined in zip(paths[1:], join.tolist()):
+        if (joined):
+            tore[-1].extend(path)
+        else:
+            tore.append(list(path))
+    return tore, int(join.sum())
+
+def iter_join_paths(paths, tol=0.05, stats=None):
+    """
+    join_paths for an iterable of paths, yielding the joined
+    paths as it goes so only one path is held at a time.
+    If given, the dict stats counts the 'paths' read and
+    the 'joins' made (ie: pen lifts saved) so far.
+    """
+    if (stats is None):
+        stats = {}
+    stats['paths'] = 0
+    stats['joins'] = 0
+    parts = []
+    for path in paths:
+        if (len(path)<2):
+            continue
+        stats['paths'] += 1
+        A = np.asarray(path, dtype=np.float64)
+        if (len(parts)>0):
+            gap = A[0] - parts[-1][-1]
+            if (np.sqrt((gap*gap).sum()) > tol):
+                yield np.concatenate(parts, 0)
+                parts = []
+            else:
+                stats['joins'] += 1
+        parts.append(A)
+    if (len(parts)>0):
+        yield np.concatenate(parts, 0)
+
+def greedy_order(paths, start=None, reverse=True):
+    """
+    Nearest neighbor ordering of paths. From the end of each
+    path it goes to the closest unvisited path start (or end,
+    if reverse, in which case that path is drawn backwards).
+    Uses a KD-tree over the path ends, with visited ends
+    skipped by widening the query and the tree rebuilt
+    once half of it is visited, so it's ~n log(n).
+
+    Args:
+        paths: list of paths with >= 2 vertices.
+        start: where the pen starts, defaults to the first path's start.
+    Returns:
+        order: (n,) indices of paths in drawing order.
+        flip: (n,) bool, True where the path should be reversed.
+    """
+    from scipy.spatial import cKDTree
+    n = len(paths)
+    if (n==0):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool)
+    starts, ends = path_ends(paths)
+    if (start is None):
+        start = starts[0]
+    pts = np.concatenate([starts, ends], 0) if reverse else starts
+    n_pts = len(pts)
+    visited = np.zeros(n, dtype=bool)
+    order = np.zeros(n, dtype=np.int64)
+    flip = np.zeros(n, dtype=bool)
+    alive = np.arange(n_pts)
+    tree = cKDTree(pts)
+    n_dead = 0
+    pos = np.asarray(start, dtype=np.float64)
+    for K in range(n):
+        if (n_dead > len(alive)//2 and len(alive) > 64):
+            alive = alive[~visited[alive % n]]
+            tree = cKDTree(pts[alive])
+            n_dead = 0
+        k = 8
+        while True:
+            k = min(k, len(alive))
+            _, idx = tree.query(pos, k=k)
+            idx = np.atleast_1d(idx)
+            cand = alive[idx[idx < len(alive)]]
+            ok = ~visited[cand % n]
+            if (ok.any()):
+                j = int(cand[ok.argmax()])
+                break
+            k *= 4
+        path = j % n
+        visited[path] = True
+        order[K] = path
+        flip[K] = j >= n
+        pos = starts[path] if flip[K] else ends[path]
+        n_dead += 2 if reverse else 1
+    return order, flip
+
+def reorder(paths, order, flip):
+    """
+    Paths in order, reversing those flagged in flip.
+    """
+    tore = []
+    for K, F in zip(order.tolist(), flip.tolist()):
+        if (F):
+            tore.append(paths[K][::-1])
+        else:
+            tore.append(paths[K])
+    return tore
+
+def order_cost(starts, ends, order, flip):
+    """
+    Total L1 travel between consecutive paths in order.
+    """
+    heads = np.where(flip[:,np.newaxis], ends[order], starts[order])
+    tails = np.where(flip[:,np.newaxis], starts[order], ends[order])
+    return float(np.abs(heads[1:]-tails[:-1]).sum())
+
+def improve_order(starts, ends, budget=10., k=8):
+    """
+    Improves an ordering of paths with 2-opt (reversing a run
+    of paths) and Or-opt (moving one path, maybe reversed)
+    moves, until no move helps or budget seconds are spent.
+    Moves are only tried towards the k nearest path ends
+    of each path end so it scales to ~1e5 paths.
+    The first path stays first.
+
+    Args:
+        starts, ends: (n,2) path ends in some cost space
+            (ie: L,R steps) where travel costs L1 distance.
+        budget: seconds to spend.
+    Returns:
+        order: (n,) indices of paths in drawing order.
+        flip: (n,) bool, True where the path should be reversed.
+    """
+    import time
+    from scipy.spatial import cKDTree
+    t0 = time.time()
+    n = len(starts)
+    order = np.arange(n)
+    flip = np.zeros(n, dtype=bool)
+    if (n<3):
+        return order, flip
+    pos = np.arange(n)
+    pts = np.concatenate([starts, ends], 0)
+    P = pts.tolist()
+    neigh = cKDTree(pts).query(pts, k=min(k+1, 2*n), p=1)[1][:,1:].tolist()
+    def d(a, b):
+        return abs(P[a][0]-P[b][0]) + abs(P[a][1]-P[b][1])
+    def head(p):
+        q = order[p]
+        return q+n if flip[q] else q
+    def tail(p):
+        q = order[p]
+        return q if flip[q] else q+n
+    def two_opt(lo, hi):
+        """
+        Gain of reversing the paths at positions lo+1...hi
+        """
+        a, b, c = tail(lo), head(lo+1), tail(hi)
+        gain = d(a,b) - d(a,c)
+        if (hi+1<n):
+            e = head(hi+1)
+            gain += d(c,e) - d(b,e)
+        return gain
+    def apply_two_opt(lo, hi):
+        seg = order[lo+1:hi+1][::-1].copy()
+        order[lo+1:hi+1] = seg
+        flip[seg] = ~flip[seg]
+        pos[seg] = np.arange(lo+1, hi+1)
+    def or_opt(j, i, rev):
+        """
+        Gain of moving the path at position j to after position i.
+        """
+        h, t = head(j), tail(j)
+        gain = d(tail(j-1), h)
+        if (j+1<n):
+            gain += d(t, head(j+1)) - d(tail(j-1), head(j+1))
+        if (rev):
+            h, t = t, h
+        a = tail(i)
+        gain -= d(a, h)
+        if (i+1<n):
+            b = head(i+1)
+            gain -= d(t, b) - d(a, b)
+        return gain
+    def apply_or_opt(j, i, rev):
+        q = order[j]
+        if (i<j):
+            lo, hi = i+1, j
+            order[lo:hi+1] = np.roll(order[lo:hi+1], 1)
+        else:
+            lo, hi = j, i
+            order[lo:hi+1] = np.roll(order[lo:hi+1], -1)
+        pos[order[lo:hi+1]] = np.arange(lo, hi+1)
+        if (rev):
+            flip[q] = ~flip[q]
+    improved = True
+    while (improved and time.time()-t0 < budget):
+        improved = False
+        for i in range(n-1):
+            if (time.time()-t0 > budget):
+                break
+            a = tail(i)
+            for c in neigh[a]:
+                q = c % n
+                j = int(pos[q])
+                if (j == i):
+                    continue
+                c_is_tail = (c >= n) != flip[q]
+                if (c_is_tail):
+                    lo, hi = min(i,j), max(i,j)
+                    if (two_opt(lo, hi) > 1e-9):
+                        apply_two_opt(lo, hi)
+                        improved = True
+                        break
+                    if (j > 0 and j != i+1 and or_opt(j, i, True) > 1e-9):
+                        apply_or_opt(j, i, True)
+                        improved = True
+                        break
+                elif (j > 0 and j != i+1 and or_opt(j, i, False) > 1e-9):
+                    apply_or_opt(j, i, False)
+                    improved = True
+                    break
+    return order, flip[order]
@@ -20,6 +20,10 @@
 # lines = [vertices] (ie: [[1.,1.],[1.,2.]])
 # pickle the path list, put in the working directory.
 # and call "pl=plotter()" that's it.
+# Big jobs load much faster as .pgp files
+# ("python3 path_file.py job.pkl", see path_file.py)
+# or can be compiled to motor steps on the desktop
+# ("python3 plotter.py compile job.pkl", see step_stream.py)
 #
 # These lists can be made from jpg by some of the
 # 'lineifiers' in the lineifiers file.
@@ -48,8 +52,22 @@
 # Distributed under Creative Commons Share-alike license.
 #
 from math import sqrt, pow, cos, sin, pi, atan
-import copy, pickle, os, time
+import pickle, os, time
 import numpy as np
+import step_plan, path_planning, path_file, step_stream, checkpoint, telemetry
+from simulation import RingLog, render_trace
+# A virtual clock, for mock and simulated plotters.
+class timeclass:
+    def __init__(self):
+        self.TIMER = 0
+    def time(self):
+        return self.TIMER
+    def perf_counter(self):
+        return self.TIMER
+    def sleep(self,X):
+        self.TIMER += X
+    def hours(self):
+        return self.TIMER/(3600.)
 HAS_ADAF = True
 try:
     from plotter_kit import *
@@ -64,15 +82,6 @@ except Exception as Ex:
     print("I'm a mock plotter now.")
     HAS_ADAF = False
     # Also mock time.
-    class timeclass:
-        def __init__(self):
-            self.TIMER = 0
-        def time(self):
-            return self.TIMER
-        def sleep(self,X):
-            self.TIMER += X
-        def hours(self):
-            return self.TIMER/(3600.)
     time = timeclass()
 def sign(X):
     if X>0:
@@ -88,13 +97,6 @@ def ngon(X=0, Y=0, r=1, n=6, phase = 0):
         pts.append([X + r*cos(K*step+phase),
                     Y+r*sin(K*step+phase)])
     return pts
-def depth(l):
-    if isinstance(l, list):
-        if (len(l)==0):
-            return 1
-        return 1 + max(depth(item) for item in l)
-    else:
-        return 0
 class Interpolation:
     def __init__(self, xmax, ymax, npts=6, pad=10.):
         """
@@ -119,13 +121,102 @@ class Interpolation:
         n = w.sum()
         w /= n
         return (self.Zs*(w[:,np.newaxis])).sum(0).tolist()
+class StepClock:
+    def __init__(self, timer=None, spin=0.0005, resync=0.05):
+        """
+        Times steps against absolute perf_counter() deadlines
+        so I2C latency, python overhead and sleep overshoot
+        don't add up over millions of steps.
+
+        spin: busy-wait this many seconds before each deadline
+              instead of trusting sleep() with them. (0 = never)
+        resync: if a step is later than this the schedule is
+              restarted from now rather than rushing to catch up.
+        """
+        if (timer is None):
+            timer = time
+        self.timer = timer
+        self.spin = spin
+        self.resync_after = resync
+        self.reset()
+    def reset(self):
+        """
+        Starts a new job. Clears the statistics.
+        """
+        self.deadline = None
+        self.t0 = self.timer.perf_counter()
+        self.n = 0
+        self.late_sum = 0.
+        self.late_sq = 0.
+        self.late_max = 0.
+        self.overruns = 0
+        self.wait_time = 0. # in wait()
+        self.sleep_time = 0. # in sleep()
+    def resync(self):
+        """
+        The next step is scheduled from now.
+        """
+        self.deadline = None
+    def sleep(self, X):
+        """
+        An untimed pause (ie: a pen lift). Restarts the schedule.
+        """
+        t0 = self.timer.perf_counter()
+        self.timer.sleep(X)
+        self.sleep_time += self.timer.perf_counter() - t0
+        self.resync()
+    def wait(self, delay):
+        """
+        Waits until delay after the previous deadline.
+        """
+        now = self.timer.perf_counter()
+        if (self.deadline is None):
+            self.deadline = now
+        self.deadline += delay
+        remaining = self.deadline - now
+        if (self.spin > 0):
+            if (remaining > self.spin):
+                self.timer.sleep(remaining - self.spin)
+            while self.timer.perf_counter() < self.deadline:
+                pass
+        elif (remaining > 0):
+            self.timer.sleep(remaining)
+        end = self.timer.perf_counter()
+        self.wait_time += end - now
+        late = end - self.deadline
+        self.n += 1
+        self.late_sum += late
+        self.late_sq += late*late
+        if (late > self.late_max):
+            self.late_max = late
+        if (late > self.resync_after):
+            self.overruns += 1
+            self.deadline = None
+        return
+    def stats(self):
+        """
+        Jitter (lateness of steps vs. their deadline) and
+        overrun statistics since the last reset()
+        """
+        n = max(self.n, 1)
+        mean = self.late_sum/n
+        return {'steps': self.n,
+                'elapsed': self.timer.perf_counter() - self.t0,
+                'mean_late': mean,
+                'std_late': sqrt(max(self.late_sq/n - mean*mean, 0.)),
+                'max_late': self.late_max,
+                'overruns': self.overruns}
 class JStepper:
     def __init__(self, ada_stepper,
                 step_delay = 0.05,
-                style = 'INTERLEAVE'):
+                style = 'INTERLEAVE',
+                clock = None):
         self.step = ada_stepper
         self.mock = ada_stepper is None
         self.step_delay = step_delay
+        if (clock is None):
+            clock = StepClock()
+        self.clock = clock
         if (not self.mock):
             self.CWd = FORWARD
             self.CCWd = BACKWARD
@@ -145,7 +236,8 @@ class JStepper:
             self.step_type = None
         self.odo = 0
         self.step_pos = 0
-        self.log = []
+        self.log = RingLog(1<<12, 2) # (time, odo) after each move (mock only)
+        self.metrics = None # a telemetry.Metrics to time I2C in.
         return
     def release(self):
         if (not self.step is None):
@@ -153,60 +245,95 @@ class JStepper:
     @property
     def angle(self):
         return 360.0*self.step_pos/self.steps_per_rev
-    def CW(self,n=1):
+    def CW(self,n=1,delay=None):
+        if (delay is None):
+            delay = self.step_delay
         for k in range(n):
             self.odo += 1
             self.step_pos = self.odo % self.steps_per_rev
             if (not self.mock):
-                self.step.onestep(direction=self.CWd,
-                                    style=self.step_type)
-                time.sleep(self.step_delay)
-            else:
-                time.sleep(self.step_delay)
-                self.log.append([time.time(), self.odo])
-    def CCW(self,n=1):
+                if (self.metrics is None):
+                    self.step.onestep(direction=self.CWd,
+                                        style=self.step_type)
+                else:
+                    t0 = self.clock.timer.perf_counter()
+                    self.step.onestep(direction=self.CWd,
+                                        style=self.step_type)
+                    self.metrics.values['i2c'] += self.clock.timer.perf_counter() - t0
+            self.clock.wait(delay)
+        if (self.mock):
+            self.log.append([self.clock.timer.time(), self.odo])
+    def CCW(self,n=1,delay=None):
+        if (delay is None):
+            delay = self.step_delay
         for k in range(n):
             self.odo -= 1
             self.step_pos = self.odo % self.steps_per_rev
             if (not self.mock):
-                self.step.onestep(direction=self.CCWd,
-                                   style=self.step_type)
-                time.sleep(self.step_delay)
-            else:
-                time.sleep(self.step_delay)
-                self.log.append([time.time(), self.odo])
+                if (self.metrics is None):
+                    self.step.onestep(direction=self.CCWd,
+                                       style=self.step_type)
+                else:
+                    t0 = self.clock.timer.perf_counter()
+                    self.step.onestep(direction=self.CCWd,
+                                       style=self.step_type)
+                    self.metrics.values['i2c'] += self.clock.timer.perf_counter() - t0
+            self.clock.wait(delay)
+        if (self.mock):
+            self.log.append([self.clock.timer.time(), self.odo])
         return
 class Lifter:
-    def __init__(self, a_servo):
+    def __init__(self, a_servo, clock=None):
         self.servo = a_servo
         self.mock = a_servo is None
+        if (clock is None):
+            clock = StepClock()
+        self.clock = clock
         self.state = 0 # 0=down, 1=up
         self.step_delay = 0.3
         if (not self.mock):
             self.servo.actuation_range = 160
             self.servo.angle = 60
-        self.log = []
+        self.log = RingLog(1<<12, 2) # (time, angle) of moves (mock only)
+        self.lifts = 0 # servo moves made
+        self.skipped = 0 # moves skipped because the pen was already there.
         return
-    def up(self):
+    def up(self, force=False):
+        """
+        Raises the pen, unless it is already up.
+        """
+        if (self.state == 1 and not force):
+            self.skipped += 1
+            return
+        self.lifts += 1
         if not self.mock:
             self.servo.angle = 160
-            time.sleep(self.step_delay)
+            self.clock.sleep(self.step_delay)
         else:
-            time.sleep(self.step_delay)
-            self.log.append([time.time(), 60.])
+            self.clock.sleep(self.step_delay)
+            self.log.append([self.clock.timer.time(), 60.])
         self.state = 1
         return
-    def down(self):
+    def down(self, force=False):
+        """
+        Lowers the pen, unless it is already down.
+        """
+        if (self.state == 0 and not force):
+            self.skipped += 1
+            return
+        self.lifts += 1
         if not self.mock:
             self.servo.angle = 60
-            time.sleep(self.step_delay)
+            self.clock.sleep(self.step_delay)
         else:
-            time.sleep(self.step_delay)
-            self.log.append([time.time(), 0.])
+            self.clock.sleep(self.step_delay)
+            self.log.append([self.clock.timer.time(), 0.])
         self.state = 0
         return
 class Plotter:
-    def __init__(self, test=False, repl=False, debug=0, vskip=1):
+    def __init__(self, test=False, repl=False, debug=0, vskip=1, planner=None,
+                 join_tol=None, checkpoint_every=5., sim=False, interactive=None,
+                 log_size=1<<20):
         """
         All units are cm, degrees, seconds, grams
         The top of the left cog is 0,0.
@@ -220,10 +347,37 @@ class Plotter:
         dangling masses. With motors off the natural
         neutral position of the plotter along the center
         line should be found by releasing the mass.
+
+        planner is an optional motion.MotionPlanner which
+        gives each step its own delay instead of the
+        fixed JStepper.step_delay.
+
+        join_tol (cm) keeps the pen down between paths
+        whose ends are closer than that. See join_paths.
+
+        checkpoint_every (s) is how often plot_file records
+        its progress to resume from (None to never).
+
+        sim=True simulates the plotter (see simulation.py) on a
+        virtual clock, even if the hardware is there. (Without
+        the hardware the plotter is always simulated.)
+        interactive=False never waits for input(),
+        which is the default when sim.
+        log_size is how many moves the simulated pen trace keeps.
         """
-        self.log = []
+        self.sim = sim or (not HAS_ADAF)
+        self.interactive = (not sim) if interactive is None else interactive
+        # The simulation gets its own clock.
+        self.timer = timeclass() if sim else time
+        self.log = RingLog(log_size, 4) # (time, x, y, pen) after each move (sim only)
         self.debug = debug
         self.vskip = vskip
+        self.planner = planner
+        self.join_tol = join_tol
+        self.checkpoint_every = checkpoint_every
+        self.ckpt = None
+        self.metrics = None
+        self.seen = {} # what collect_metrics() last saw.
         self.initialize()
         print("Y0:",self.y0)
         print("Cog Dist {} Bottom {}".format(self.cog_distance, self.bottom_edge))
@@ -234,6 +388,8 @@ class Plotter:
                            (self.y_lim[1]-self.y_lim[0])//self.step_dl)
         # if (repl):
         #     return
+        if (not self.interactive):
+            return
         print("(r)epl or (c)hoose file. ")
         C = input()
         if (C.lower()=='r'):
@@ -243,11 +399,14 @@ class Plotter:
     def initialize(self, cog_distance = 80.5,
                     bottom_edge = 48.0,
                     steps_per_rev=400, cog_circum=1.5*2*pi,
-                    y0 = 13., x_pad = 18., y_pad = 10.
+                    y0 = 13., x_pad = 18., y_pad = 10.,
+                    pwm_freq = None
                   ):
         """
         y0 is a neutral position where the
         gondola sits without stepper force.
+        pwm_freq (ie: plotter_kit.SHARED_FREQ) runs servo and
+        steppers at one PWM frequency instead of switching.
         """
         self.bottom_edge = bottom_edge
         self.cog_distance = cog_distance
@@ -267,16 +426,18 @@ class Plotter:
                         self.y_lim[1]-self.y_lim[0])/100.
         self.L0, self.R0 = self.xy_to_LR(self.x0,self.y0)
         print("Initializing I2C... ")
-        if (HAS_ADAF):
-            self.PK = PlotterKit()
-            self.s1 = JStepper(self.PK.stepper1)
-            self.s2 = JStepper(self.PK.stepper2)
+        if (not self.sim):
+            self.clock = StepClock()
+            self.PK = PlotterKit(shared_freq=pwm_freq)
+            self.s1 = JStepper(self.PK.stepper1, clock=self.clock)
+            self.s2 = JStepper(self.PK.stepper2, clock=self.clock)
             self.steps_per_rev = self.s1.steps_per_rev
-            self.lifter = Lifter(self.PK.servo)
+            self.lifter = Lifter(self.PK.servo, clock=self.clock)
         else:
-            self.s1 = JStepper(None)
-            self.s2 = JStepper(None)
-            self.lifter = Lifter(None)
+            self.clock = StepClock(self.timer, spin=0.)
+            self.s1 = JStepper(None, clock=self.clock)
+            self.s2 = JStepper(None, clock=self.clock)
+            self.lifter = Lifter(None, clock=self.clock)
             self.debug=1
             self.steps_per_rev = 400
         self.step_dl = self.cog_circum/self.steps_per_rev
@@ -297,10 +458,12 @@ class Plotter:
         self.s1.release()
         self.s2.release()
         print("Move pen near neutral and press ENTER.")
-        _ = input()
+        if (self.interactive):
+            _ = input()
         self.motor_check()
         print("Tighten it up and press ENTER.")
-        _ = input()
+        if (self.interactive):
+            _ = input()
         self.stepsum_L=0 # these are KEY. They give the abs. positioning
         self.stepsum_R=0
         if (draw):
@@ -374,6 +537,8 @@ class Plotter:
         -----------------------------------------
         THIS IS THE ONLY way to move the plotter,
         no routine should call step_L or step_R
+        (besides run_steps, which replays the same
+        steps compiled by step_plan for whole paths.)
         """
         if (not raw):
             if (x < self.x_lim[0]):
@@ -420,14 +585,14 @@ class Plotter:
     @property
     def RR(self):
         return self.R0+self.stepsum_R*self.step_dl
-    def step_L(self, sign):
+    def step_L(self, sign, delay=None):
         """
         Sign >= => the line grows.
         """
         if sign>0:
-            self.s1.CW()
+            self.s1.CW(delay=delay)
         elif sign<0:
-            self.s1.CCW()
+            self.s1.CCW(delay=delay)
         else:
             return
         self.stepsum_L += sign
@@ -436,11 +601,11 @@ class Plotter:
             print("L sign:{:d} Lss:{:d} LL:{:0.1f}, X:{:.1f},Y:{:.1f}".format(
                       sign, self.stepsum_L, self.LL, X, Y))
         return
-    def step_R(self, sign):
+    def step_R(self, sign, delay=None):
         if sign>0:
-            self.s2.CCW()
+            self.s2.CCW(delay=delay)
         elif sign<0:
-            self.s2.CW()
+            self.s2.CW(delay=delay)
         else:
             return
         self.stepsum_R += sign
@@ -456,38 +621,251 @@ class Plotter:
         self.lifter.down()
         return
     def log_xy(self):
-        if (HAS_ADAF):
+        if (not self.sim):
             return
         X,Y = self.xy_now()
-        self.log.append([time.time(), X, Y])
+        self.log.append([self.timer.time(), X, Y, self.lifter.state])
+    def render(self, filename="trace.png"):
+        """
+        Renders the simulated pen trace to a png.
+        """
+        n = render_trace(self.log.array(), filename, self.x_lim, self.y_lim)
+        print("Rendered {} strokes to {}".format(n, filename))
+        return filename
+    def compile_vertices(self, vertices, raw=False):
+        """
+        Compiles moves from the current position through
+        vertices into (dL, dR) step events. See step_plan.
+        """
+        steps, ends, n_oob = step_plan.compile_vertices(self, vertices,
+                                start=(self.stepsum_L, self.stepsum_R), raw=raw)
+        if (n_oob>0):
+            print("oob vertices clamped: ", n_oob)
+            if (self.metrics is not None):
+                self.metrics.add('vertices_clamped', n_oob)
+        return steps, ends
+    def estimate(self, paths, chunk=100000):
+        """
+        Predicted steps, pen lifts and seconds to draw
+        (scaled) paths from here. See step_plan.estimate
+        paths can be any iterable, it's estimated
+        chunk vertices at a time.
+        """
+        start = (self.stepsum_L, self.stepsum_R)
+        tore = None
+        for batch in step_plan.chunks((path[::self.vskip] for path in paths), chunk):
+            E = step_plan.estimate(self, batch, start=start,
+                                   step_delay=self.s1.step_delay,
+                                   lift_delay=self.lifter.step_delay,
+                                   planner=self.planner)
+            start = step_plan.end_steps(self, batch[-1][-1])
+            if (tore is None):
+                tore = E
+            else:
+                for key in tore:
+                    tore[key] += E[key]
+        if (tore is None):
+            tore = step_plan.estimate(self, [])
+        return tore
+    def print_estimate(self, paths):
+        E = self.estimate(paths)
+        print("Estimate: {paths} paths {vertices} vertices, steps L:{steps_L} R:{steps_R} "
+              "(travel {travel_steps}), {pen_lifts} lifts, {hours:.2f} hours".format(**E))
+        return E
+    def run_steps(self, steps, ends=None, offset=0, delays=None, vertex=None):
+        """
+        Replays compiled step events from offset up to ends[-1].
+        Logs xy at the end of each non-empty move.
+        delays optionally gives the delay after each step.
+        vertex is the index of the vertex the pen starts at,
+        given when drawing so progress can be checkpointed.
+        """
+        if (ends is None):
+            ends = [len(steps)]
+        step_L = self.step_L
+        step_R = self.step_R
+        ckpt = self.ckpt if vertex is not None else None
+        lo = offset
+        for I, hi in enumerate(ends):
+            if (ckpt is not None and ckpt.due()):
+                ckpt.write(ckpt.first + (vertex+I)*self.vskip, self.stepsum_L,
+                           self.stepsum_R, self.lifter.state)
+            if (hi <= lo):
+                continue
+            if (delays is None):
+                for dL, dR in steps[lo:hi].tolist():
+                    if dL:
+                        step_L(dL)
+                    else:
+                        step_R(dR)
+            else:
+                for (dL, dR), dt in zip(steps[lo:hi].tolist(), delays[lo:hi].tolist()):
+                    if dL:
+                        step_L(dL, dt)
+                    else:
+                        step_R(dR, dt)
+            self.log_xy()
+            lo = hi
+        return
+    def plan_delays(self, vertices, ends):
+        """
+        Per step delays from the planner for compiled vertices.
+        The pen stops at the first vertex (to lower the pen)
+        so the travel there and the drawing are planned apart.
+        """
+        xy, _ = step_plan.clamp_xy(vertices, self.x_lim, self.y_lim)
+        counts = np.diff(np.concatenate([[0], ends]))
+        return np.concatenate([self.planner(self.XY, xy[:1], counts[:1]),
+                               self.planner(xy[0], xy[1:], counts[1:])])
     def draw_vertices(self, vertices_, cycle=False):
         vertices = vertices_[::self.vskip]
         print("Drawing ", len(vertices), " vertices ")
-        t0 = time.time()
+        t0 = self.timer.time()
         if (len(vertices)<2):
             return
+        n_drawn = len(vertices)
+        if (cycle):
+            vertices = np.concatenate([np.asarray(vertices), np.asarray(vertices[:1])], 0)
+        M = self.metrics
+        if (M is not None):
+            tg = self.timer.perf_counter()
+        steps, ends = self.compile_vertices(vertices)
+        delays = None
+        if (self.planner is not None):
+            delays = self.plan_delays(vertices, ends)
+        if (M is not None):
+            M.add('geometry', self.timer.perf_counter() - tg)
+            M.add('paths')
+            # The closing vertex of a cycle is not a vertex of vertices_.
+            M.add('vertices', n_drawn)
+            M.add('vertices_skipped', len(vertices_) - n_drawn)
         self.pen_up()
-        self.move_to(*vertices[0])
+        self.run_steps(steps, ends[:1], delays=delays)
         self.pen_down()
-        for K,v in enumerate(vertices):
-            if (K%1000==0):
-                print(K,"/",len(vertices)," X{:.2f} Y{:.2f} ".format(*self.XY),
-                                    "L{:.1f} R{:.1f}".format(*self.LR))
-                print("L {:0.1f} (o)".format(self.s1.angle), self.s1.odo, self.stepsum_L)
-                print("R {:0.1f} (o)".format(self.s2.angle), self.s2.odo, self.stepsum_R)
-            self.move_to(*v)
-        if (cycle):
-            self.move_to(*vertices[0])
+        for K in range(1, len(ends), 1000):
+            print(K,"/",len(vertices)," X{:.2f} Y{:.2f} ".format(*self.XY),
+                                "L{:.1f} R{:.1f}".format(*self.LR))
+            print("L {:0.1f} (o)".format(self.s1.angle), self.s1.odo, self.stepsum_L)
+            print("R {:0.1f} (o)".format(self.s2.angle), self.s2.odo, self.stepsum_R)
+            self.run_steps(steps, ends[K:K+1000], offset=ends[K-1], delays=delays,
+                           vertex=K-1)
+            if (M is not None and M.due()):
+                self.collect_metrics()
+                M.write()
         self.pen_up()
-        print("took ", time.time()-t0, "s")
+        print("took ", self.timer.time()-t0, "s")
         return
-    def draw_paths(self, paths):
+    def enable_metrics(self, filename=None, every=10.):
+        """
+        Starts recording telemetry.Metrics of everything
+        drawn from now on, and optionally streams them to
+        filename (.csv or .jsonl) every so many seconds.
+        """
+        self.disable_metrics()
+        self.metrics = telemetry.Metrics(filename, every, timer=self.timer.perf_counter)
+        self.s1.metrics = self.metrics
+        self.s2.metrics = self.metrics
+        self.seen = {}
+        self.collect_metrics()
+        # Only count from now on.
+        for key, value in self.seen.items():
+            self.metrics.values[key] = 0
+        return self.metrics
+    def disable_metrics(self):
+        if (self.metrics is not None):
+            self.collect_metrics()
+            self.metrics.write()
+            self.metrics.close()
+        self.metrics = None
+        self.s1.metrics = None
+        self.s2.metrics = None
+    def collect_metrics(self):
+        """
+        Adds what the clock, the lifter and the PWM board
+        counted since the last collect to the metrics.
+        """
+        M = self.metrics
+        if (M is None):
+            return
+        now = {'steps': self.clock.n, 'step_wait': self.clock.wait_time,
+               'pen': self.clock.sleep_time, 'pen_lifts': self.lifter.lifts,
+               'lifts_skipped': self.lifter.skipped}
+        if (not self.sim):
+            now['mode_switches'] = self.PK.mode_switches
+            now['mode_switch'] = self.PK.mode_switch_time
+        for key, value in now.items():
+            M.add(key, value - self.seen.get(key, 0))
+        self.seen = now
+    def reset_stats(self):
+        self.collect_metrics()
+        self.seen = {}
+        self.clock.reset()
+        self.lifter.lifts = 0
+        self.lifter.skipped = 0
+        if (not self.sim):
+            self.PK.mode_switches = 0
+            self.PK.mode_switch_time = 0.
+    def print_timing(self):
+        """
+        Step timing jitter and overruns, pen lifts and
+        PWM mode switches of the job.
+        """
+        print("Steps: {steps} in {elapsed:.1f}s late: mean {mean_late:.2e}s "
+              "std {std_late:.2e}s max {max_late:.2e}s overruns: {overruns}".format(
+              **self.clock.stats()))
+        print("Pen moves: {} ({:.1f}s) skipped: {}".format(self.lifter.lifts,
+              self.lifter.lifts*self.lifter.step_delay, self.lifter.skipped))
+        if (not self.sim):
+            print("PWM mode switches: {} ({:.2f}s)".format(self.PK.mode_switches,
+                  self.PK.mode_switch_time))
+        if (self.metrics is not None):
+            self.collect_metrics()
+            print(self.metrics)
+    def draw_paths(self, paths, join_tol=None, n_paths=None, start=None):
+        """
+        Draws a list (or any iterable) of paths.
+        n_paths is only for the progress count of iterables.
+        start=(path, vertex) resumes from a checkpoint, with
+        (path, vertex, stepsum_L, stepsum_R) warns if the vertex
+        isn't where the checkpoint had the pen (ie: the geometry
+        or scaling changed since).
+        Returns False if quit.
+        """
+        if (n_paths is None):
+            n_paths = len(paths) if hasattr(paths, '__len__') else '?'
+        if (join_tol is None):
+            join_tol = self.join_tol
+        joins = None
+        if (join_tol):
+            if (not type(paths)==list):
+                joins = {}
+            paths = self.join_paths(paths, join_tol, joins)
         self.init_pen()
+        self.reset_stats()
+        ckpt = self.ckpt
         for K,path in enumerate(paths):
+            first = 0
+            if (start is not None):
+                if (K < start[0]):
+                    continue
+                if (K == start[0]):
+                    first = start[1]
+                    path = path[first:]
+                    if (len(start)>2 and len(path)>0):
+                        L, R = step_plan.end_steps(self, path[0])
+                        if (abs(L-start[2])>1 or abs(R-start[3])>1):
+                            print("WARNING: the checkpoint had the pen at L:{} R:{} but this "
+                                  "vertex is at L:{} R:{}, did the geometry change?".format(
+                                  start[2], start[3], L, R))
+            if (ckpt is not None):
+                ckpt.path = K
+                ckpt.first = first
             try:
-                print(K, "/", len(paths))
+                print(K, "/", n_paths)
                 self.draw_vertices(path)
             except KeyboardInterrupt:
+                if (not self.interactive):
+                    raise
                 print("(C)ontinue (P)ause (Q)uit these vertices:?")
                 inp = input()
                 if (inp.lower().count('c')>0):
@@ -503,43 +881,74 @@ class Plotter:
                     self.pen_up()
                     self.s1.release()
                     self.s2.release()
-                    return
-        return
+                    if (joins is not None):
+                        self.print_joins(joins['paths'], joins['joins'])
+                    self.print_timing()
+                    return False
+        if (joins is not None):
+            self.print_joins(joins['paths'], joins['joins'])
+        self.print_timing()
+        return True
     ###################
     # Path planning, scaling, etc.
     ###################
-    def sched_paths(self, paths, n_fog = 1000):
+    def sched_paths(self, paths, reverse=True):
         """
-        Greedily plans paths to minimize time.
-        sorts by X to begin with. Looks at
-        the next n_fog
+        Greedily plans paths to minimize pen-up travel.
+        Starts with the first path, then always goes to the
+        nearest start (or end, then drawing it reversed)
+        of the remaining paths. See path_planning.greedy_order
         """
-        if (len(paths)<=0):
-            return
+        paths = [X for X in paths if len(X)>1]
         if (len(paths)<2):
             return paths
-        paths_scheduled = [0]
-        paths_remaining = [X for X in range(1,len(paths)) if len(paths[X])>1]
-        print("Planning ", len(paths_remaining), " paths.")
-        endpt = lambda X: paths[X][-1]
-        def endpt_dist(x,y,K):
-            ep = endpt(K)
-            return sqrt(pow(ep[0]-x, 2.0)+pow(ep[1]-y,2.0))
-        while (len(paths_remaining)>1):
-            X = endpt(paths_scheduled[-1])
-            distances = []
-            for K in paths_remaining[:1000]:
-                distances.append(endpt_dist(X[0], X[1], K))
-            min_di = distances.index(min(distances))
-            min_k = paths_remaining[min_di]
-            paths_scheduled.append(min_k)
-            paths_remaining.remove(min_k)
-        if (len(paths_remaining)>0):
-            paths_scheduled.append(paths_remaining.pop())
-        tore = []
-        for K,sched in enumerate(paths_scheduled):
-            tore.append(copy.copy(paths[sched]))
+        print("Planning ", len(paths), " paths.")
+        order, flip = path_planning.greedy_order(paths, reverse=reverse)
+        tore = path_planning.reorder(paths, order, flip)
+        print("Pen-up travel: {:.1f} => {:.1f}".format(path_planning.travel_distance(paths),
+                                                      path_planning.travel_distance(tore)))
         return tore
+    def improve_paths(self, paths, budget=10., cbds=None, rotate=False):
+        """
+        Improves the order of (scheduled) paths with 2-opt and
+        Or-opt moves for budget seconds. Travel is costed in
+        L,R steps, which is what it costs the plotter.
+        If the paths aren't scaled yet, give the bounds
+        (and rotation) plot_file will scale them with.
+        See path_planning.improve_order
+        """
+        paths = [X for X in paths if len(X)>1]
+        if (len(paths)<3):
+            return paths
+        starts, ends = path_planning.path_ends(paths)
+        pts = np.concatenate([starts, ends], 0)
+        if (rotate):
+            pts = pts[:,::-1]*np.array([[-1.,1.]])
+        if (cbds is not None):
+            scale_fac, Shift = self.scale_transform(cbds)
+            pts = pts*scale_fac + Shift
+        LR = step_plan.xy_to_LR(pts, self.cog_distance)/self.step_dl
+        S, E = LR[:len(paths)], LR[len(paths):]
+        order, flip = path_planning.improve_order(S, E, budget)
+        print("Pen-up travel (steps): {:.0f} => {:.0f}".format(
+              path_planning.order_cost(S, E, np.arange(len(paths)), np.zeros(len(paths), dtype=bool)),
+              path_planning.order_cost(S, E, order, flip)))
+        return path_planning.reorder(paths, order, flip)
+    def join_paths(self, paths, tol=0.05, stats=None):
+        """
+        Merges paths which end within tol of the next
+        path's start so the pen stays down over the gap.
+        Iterables other than lists are joined lazily, counting
+        into the dict stats (see print_joins) as they're drawn.
+        """
+        if (not type(paths)==list):
+            return path_planning.iter_join_paths(paths, tol, stats)
+        joined, n_saved = path_planning.join_paths(paths, tol)
+        self.print_joins(len(joined)+n_saved, n_saved)
+        return joined
+    def print_joins(self, n_paths, n_saved):
+        print("Joined {} paths into {}, saved {} lifts ({:.1f}s)".format(
+              n_paths, n_paths-n_saved, n_saved, 2*n_saved*self.lifter.step_delay))
     def path_bounds(self,path):
         A = np.array(path)
         if (len(A.shape) != 2):
@@ -550,7 +959,11 @@ class Plotter:
             raise Exception("Bad Path")
         return A.min(0).tolist()+A.max(0).tolist()
     def paths_bounds(self, paths):
-        if (not type(paths)==list):
+        if (isinstance(paths, np.ndarray) and paths.ndim==3 and paths.shape[1]>=2 and len(paths)):
+            # (n_paths, n_vertices, 2) like the lineifiers make.
+            A = paths.reshape(-1,2)
+            return A.min(0).tolist()+A.max(0).tolist()
+        if (not isinstance(paths, (list, tuple))):
             X,Y = self.center
             return [X,Y,X,Y]
         L = [self.path_bounds(X) for X in paths if len(X)>=2]
@@ -566,10 +979,7 @@ class Plotter:
         self.paths_bounds(cymk[3])])
         return A[:,:2].min(0).tolist()+A[:,2:].max(0).tolist()
     def aspect(self,cbds):
-        x_dim = cbds[2]-cbds[0]
-        y_dim = cbds[3]-cbds[1]
-        ar_paths = x_dim/y_dim
-        return ar_paths
+        return step_plan.aspect(cbds)
     def rotate_paths(self,paths):
         tore = []
         for path in paths:
@@ -578,12 +988,23 @@ class Plotter:
                 npath.append([-1*vertex[1],vertex[0]])
             tore.append(npath)
         return tore
+    def rotate_bounds(self, cbds):
+        """
+        Bounds of rotate_paths(paths) for paths with bounds cbds.
+        """
+        return [-cbds[3], cbds[0], -cbds[1], cbds[2]]
     def auto_rotate(self, paths, cbds):
         AR = self.aspect(cbds)
         if AR<1:
             print("Auto-Rotating.... !!!!!-----")
             return self.rotate_paths(paths)
         return paths
+    def scale_transform(self, cbds, reduction = 1.0):
+        """
+        scale_fac, Shift so that xy*scale_fac + Shift
+        fits data with bounds cbds into the plot area.
+        """
+        return step_plan.scale_transform(self, cbds, reduction)
     def scale_paths(self, paths, cbds, reduction = 1.0):
         """
         Fit a line drawing into the plot area. while
@@ -591,20 +1012,8 @@ class Plotter:
         Also moves image to bottom of plot area
         (for best results. )
         """
-        x_dim = cbds[2]-cbds[0]
-        y_dim = cbds[3]-cbds[1]
-        c_paths = [(cbds[2]+cbds[0])/2., (cbds[3]+cbds[1])/2.]
-        ar_paths = x_dim/y_dim
-        ar_self = (self.x_lim[1]-self.x_lim[0])/(self.y_lim[1]-self.y_lim[0])
-        if ar_paths < ar_self:
-            # y is the limiting.
-            scale_fac = abs(.99*(self.y_lim[1]-self.y_lim[0])/y_dim)*reduction
-        else:
-            scale_fac = abs(.99*(self.x_lim[1]-self.x_lim[0])/x_dim)*reduction
-        origin_shift = np.array([[c_paths[0],c_paths[1]]])
+        scale_fac, Shift = self.scale_transform(cbds, reduction)
         new_paths = []
-        Pc = np.array([[(self.x_lim[1]+self.x_lim[0])/2, (self.y_lim[1]+self.y_lim[0])/2]])
-        Shift = Pc - scale_fac*origin_shift
         if (paths is None):
             return []
         for p in paths:
@@ -613,6 +1022,31 @@ class Plotter:
             A = np.array(p)*scale_fac + Shift
             new_paths.append(A.tolist())
         return new_paths
+    def stream_paths(self, paths, cbds, rotate=False, reduction = 1.0):
+        """
+        Generator of paths rotated (if rotate) and scaled
+        into the plot area like auto_rotate and scale_paths,
+        one path at a time, so nothing is copied up front.
+        cbds are the bounds of the unrotated paths.
+        """
+        if (rotate):
+            cbds = self.rotate_bounds(cbds)
+        scale_fac, Shift = self.scale_transform(cbds, reduction)
+        for p in paths:
+            if (len(p)<2):
+                continue
+            A = np.asarray(p, dtype=np.float64)
+            if (rotate):
+                A = A[:,::-1]*np.array([[-1.,1.]])
+            yield A*scale_fac + Shift
+    def stream_bounds(self, cbds, rotate=False, reduction = 1.0):
+        """
+        Bounds of what stream_paths yields.
+        """
+        if (rotate):
+            cbds = self.rotate_bounds(cbds)
+        scale_fac, Shift = self.scale_transform(cbds, reduction)
+        return (np.array(cbds).reshape(2,2)*scale_fac + Shift).reshape(4).tolist()
     #######
     # Basic Shapes.
     #######
@@ -669,79 +1103,206 @@ class Plotter:
             x1 = xc+NN
             y1 = yc+NN
         return
-    def pre_process_file(self, filename):
+    def load_file(self, filename):
+        """
+        Loads a pickled path list or a .pgp path file.
+
+        Returns:
+            DATA: paths or [c_paths, y_paths, m_paths, k_paths]
+            cymk: True for CYMK data.
+            cbds: bounds of DATA if the file knows them, else None.
+        """
+        if (path_file.is_path_file(filename)):
+            PF = path_file.PathFile(filename)
+            return PF.data(), PF.cymk, PF.bounds
         with open(filename,'rb') as f:
             DATA = pickle.load(f)
-        OPATHS = self.pre_process(DATA)
+        # CYMK is 4 X paths X pts X 2
+        # B/W is paths X pts X 2
+        # (lists or arrays, see path_file.is_cymk)
+        return DATA, path_file.is_cymk(DATA), None
+    def pre_process_file(self, filename, budget=0.):
+        """
+        Writes filename_processed.pkl (or .pgp if given a .pgp file)
+        """
+        DATA, cymk, _ = self.load_file(filename)
+        OPATHS = self.pre_process(DATA, budget, cymk)
+        if (filename.endswith('.pgp')):
+            path_file.write_paths(filename[:-4]+"_processed.pgp", OPATHS, cymk)
+            return
         with open(filename.split('.')[0]+"_processed.pkl",'wb') as f:
             pickle.dump(OPATHS, f)
-    def pre_process(self, DATA):
+    def pre_process(self, DATA, budget=0., cymk=None):
         """
         Rotates, scales, plans
+        budget > 0 spends that many seconds improving
+        the schedule with improve_paths.
+        cymk: whether DATA is CYMK, found from its shape if None.
         """
-        # Determine the depth.
         # CYMK is 4 X paths X pts X 2
         # B/W is paths X pts X 2
-        if depth(DATA)==4:
-            OPATHS = [self.sched_paths(channel, self.cymk_bounds(DATA)) for channel in DATA]
+        if (cymk is None):
+            cymk = path_file.is_cymk(DATA)
+        if cymk:
+            OPATHS = [self.sched_paths(channel) for channel in DATA]
             print("Scheduled paths.")
+            if (budget>0):
+                cbds = self.cymk_bounds(DATA)
+                OPATHS = [self.improve_paths(channel, budget/4., cbds) for channel in OPATHS]
         else:
             OPATHS = self.sched_paths(DATA)
             print("Scheduled paths.")
+            if (budget>0):
+                cbds = self.paths_bounds(DATA)
+                rotate = self.aspect(cbds)<1
+                if (rotate):
+                    cbds = self.rotate_bounds(cbds)
+                OPATHS = self.improve_paths(OPATHS, budget, cbds, rotate)
         return OPATHS
-    def plot_file(self, filename):
+    def plot_file(self, filename, estimate=False, resume=False):
         """
         Only plots files in a raw format.
         They should have been pre-processed!
+        Paths are streamed from the file through rotation,
+        scaling and compilation to the motors one at a time.
+        Drawing starts right away, estimate=True first prints
+        the time estimate (a pass over the whole file).
+        Progress is checkpointed to filename.ckpt (see checkpoint.py)
+        and resume=True continues from the last checkpoint
+        (after re-homing in init_pen).
         """
-        with open(filename,'rb') as f:
-            DATA = pickle.load(f)
-        # Determine the depth.
-        # CYMK is 4 X paths X pts X 2
-        # B/W is paths X pts X 2
-        if depth(DATA)==4:
-            print("Data Bounds: ", self.cymk_bounds(DATA))
-            print("Scaling Data....")
-            SDATA = [self.scale_paths(channel, self.cymk_bounds(DATA)) for channel in DATA]
-            cbds = self.cymk_bounds(SDATA)
-            print("Scaled Data to",cbds)
-            if cbds[0]<self.x_lim[0]-.1 or cbds[1]<self.y_lim[0]-.1 or cbds[2]>self.x_lim[1]+.1 or cbds[3]>self.y_lim[1]+.1:
-                print(cbds[0]<self.x_lim[0]-.1 , cbds[1]<self.y_lim[0]-.1 , cbds[2]>self.x_lim[1]+.1 , cbds[3]>self.y_lim[1]+.1)
-                print("File Data oob, pre_process_file() plz.")
-                return
-            # TODO Rotate CYMK
+        if (step_stream.is_stream_file(filename)):
+            self.play_stream(filename)
+            return
+        if (path_file.is_path_file(filename)):
+            PF = path_file.PathFile(filename)
+            cymk, dbds = PF.cymk, PF.bounds
+            channel = PF.iter_paths
+            channel_len = PF.channel_len
+        else:
+            DATA, cymk, _ = self.load_file(filename)
+            dbds = self.cymk_bounds(DATA) if cymk else self.paths_bounds(DATA)
+            channel = (lambda C: DATA[C]) if cymk else (lambda C: DATA)
+            channel_len = lambda C: len(channel(C))
+        print("Data Bounds: ", dbds)
+        # TODO Rotate CYMK
+        rotate = (not cymk) and self.aspect(dbds)<1
+        if (rotate):
+            print("Auto-Rotating.... !!!!!-----")
+        print("Scaling Data....")
+        cbds = self.stream_bounds(dbds, rotate)
+        print("Scaled Data to",cbds)
+        if cbds[0]<self.x_lim[0]-.1 or cbds[1]<self.y_lim[0]-.1 or cbds[2]>self.x_lim[1]+.1 or cbds[3]>self.y_lim[1]+.1:
+            print("File Data oob, pre_process_file() plz.")
+            return
+        channels = range(4) if cymk else [0]
+        if (estimate):
+            for C in channels:
+                self.print_estimate(self.stream_paths(channel(C), dbds, rotate))
+        if cymk:
             print("Ploting CYMK")
-            print("Load Cyan")
-            self.draw_paths(SDATA[0])
-            print("Load Yellow")
-            self.draw_paths(SDATA[1])
-            print("Load Magenta")
-            self.draw_paths(SDATA[2])
-            print("Load Black")
-            self.draw_paths(SDATA[3])
+            loads = ["Load Cyan", "Load Yellow", "Load Magenta", "Load Black"]
         else:
-            # This is a monochrome plot.
-            # Check the plot fits in the plot_area.
-            # This is a monochrome plot.
-            cbds = self.paths_bounds(DATA)
-            print("Data Bounds: ",cbds)
-            DATA = copy.copy(self.auto_rotate(DATA, cbds))
-            print("Scaling Data....")
-            SDATA = self.scale_paths(DATA, self.paths_bounds(DATA))
-            cbds = self.paths_bounds(SDATA)
-            print("Scaled Data to",cbds)
-            if cbds[0]<self.x_lim[0] or cbds[1]<self.y_lim[0] or cbds[2]>self.x_lim[1] or cbds[3]>self.y_lim[1]:
-                print("File Data oob, pre_process_file() plz.")
-                return
-            print("Data Bounds: ",cbds)
-            print("Load Pen.")
-            self.draw_paths(SDATA)
+            loads = ["Load Pen."]
+        ckpt_name = filename+".ckpt"
+        state = checkpoint.last_checkpoint(ckpt_name) if resume else None
+        if (state is not None and state['channel'] >= len(channels)):
+            print("The checkpointed job was finished, starting over.")
+            state = None
+        if (state is not None):
+            print("Resuming channel {channel} path {path} vertex {vertex}".format(**state))
+        elif (os.path.exists(ckpt_name)):
+            os.remove(ckpt_name)
+        if (self.checkpoint_every):
+            self.ckpt = checkpoint.Checkpointer(ckpt_name, self.checkpoint_every,
+                                                timer=self.timer.time).open()
+        finished = True
+        for C in channels:
+            start = None
+            if (state is not None):
+                if (C < state['channel']):
+                    continue
+                if (C == state['channel']):
+                    start = (state['path'], state['vertex'])
+                    if (start != (0, 0)):
+                        # Not a channel boundary, where the pen was.
+                        start += (state['stepsum_L'], state['stepsum_R'])
+            if (self.ckpt is not None):
+                self.ckpt.channel = C
+            print(loads[C])
+            done = self.draw_paths(self.stream_paths(channel(C), dbds, rotate),
+                                   n_paths=channel_len(C), start=start)
+            finished = finished and done
+            if (done and self.ckpt is not None):
+                # Resuming from here starts the next channel.
+                self.ckpt.channel = C+1
+                self.ckpt.path = 0
+                self.ckpt.first = 0
+                self.ckpt.write(0, self.stepsum_L, self.stepsum_R, self.lifter.state)
+        if (self.ckpt is not None):
+            self.ckpt.close()
+            self.ckpt = None
+        # Nothing to resume once every channel is drawn.
+        if (finished and os.path.exists(ckpt_name)):
+            os.remove(ckpt_name)
+    def play_stream(self, filename, delay=None):
+        """
+        Replays a step stream compiled on the desktop
+        (see step_stream.py) with no geometry at all.
+        delay is the step delay (default JStepper.step_delay),
+        ie: as fast as the hardware reliably steps.
+        """
+        info, records = step_stream.read_stream(filename, self)
+        print("Stream: {steps} steps in {records} records, {channels} channel(s)".format(**info))
+        ops, counts = step_stream.decode(records)
+        s1, s2 = self.s1, self.s2
+        t0 = self.timer.time()
+        try:
+            for K, (op, n) in enumerate(zip(ops.tolist(), counts.tolist())):
+                if (op==0):
+                    s1.CW(n, delay)
+                    self.stepsum_L += n
+                elif (op==1):
+                    s1.CCW(n, delay)
+                    self.stepsum_L -= n
+                elif (op==2):
+                    s2.CCW(n, delay)
+                    self.stepsum_R += n
+                elif (op==3):
+                    s2.CW(n, delay)
+                    self.stepsum_R -= n
+                elif (op==step_stream.OP_PEN):
+                    if (n):
+                        self.pen_up()
+                    else:
+                        self.pen_down()
+                elif (op==step_stream.OP_CHANNEL):
+                    if (K>0):
+                        self.print_timing()
+                    if (info['channels']>1):
+                        print("Load", step_stream.CHANNEL_NAMES[n])
+                    else:
+                        print("Load Pen.")
+                    self.init_pen()
+                    self.reset_stats()
+                if (self.sim):
+                    self.log_xy()
+                if (K%10000==0):
+                    print(K, "/", len(ops), " X{:.2f} Y{:.2f} ".format(*self.XY))
+        except KeyboardInterrupt:
+            print("Stopped at record", K)
+        self.pen_up()
+        self.s1.release()
+        self.s2.release()
+        self.print_timing()
+        print("took ", self.timer.time()-t0, "s")
+        return
     def file_picker(self, path="./"):
         files = os.listdir(path)
         print("Line Files:")
         print("----------")
         for I,f in enumerate(files):
-            if f.count('.pkl')>0:
+            if (f.count('.pkl')>0 or f.endswith('.pgp') or f.endswith('.pgs')) and not f.endswith('.ckpt'):
                 print(I,f)
         print("----------")
         print("--- Selection ---")
@@ -749,15 +1310,24 @@ class Plotter:
         return files[K]
     def choose_file(self):
         target_file = self.file_picker()
-        self.plot_file(target_file)
+        resume = False
+        if (os.path.exists(target_file+".ckpt")):
+            print("(r)esume from the last checkpoint or start (o)ver?")
+            resume = input().lower().count('r')>0
+        self.plot_file(target_file, resume=resume)
         return
     def pre_process_files(self, path="./"):
         files = os.listdir(path)
         for I,f in enumerate(files):
-            if f.count('.pkl')>0 and f.count('_processed')<1:
+            if (f.count('.pkl')>0 or f.endswith('.pgp')) and f.count('_processed')<1 and not f.endswith('.ckpt'):
                 print('processing:', f)
                 self.pre_process_file(f)
         return
 
 if __name__ == "__main__":
-    pl = Plotter(test=False, repl=True)
+    import sys
+    if (len(sys.argv)>1 and sys.argv[1]=='compile'):
+        # Desktop: python3 plotter.py compile job.pkl (see step_stream.py)
+        step_stream.main(sys.argv[2:])
+    else:
+        pl = Plotter(test=False, repl=True)
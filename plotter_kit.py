@@ -3,10 +3,9 @@
 #
 
 from math import sqrt, pow, cos, sin, pi, atan
-import copy, pickle, os, time, math
+import copy, pickle, os, time, math, struct
 import numpy as np
 
-import board
 from adafruit_register.i2c_struct import UnaryStruct
 from adafruit_register.i2c_struct_array import StructArray
 from adafruit_bus_device import i2c_device
@@ -15,6 +14,9 @@ from micropython import const
 # Constants that specify the direction and style of steps.
 STEPPER_FREQ = const(2250)
 SERVO_FREQ = const(50)
+# A compromise both can live with: servo pulses up to 2.25ms still fit in
+# the period, and the steppers tolerate (audibly) slower coil PWM.
+SHARED_FREQ = const(300)
 FORWARD = const(1)
 """Step forward"""
 BACKWARD = const(2)
@@ -29,6 +31,51 @@ MICROSTEP = const(4)
 """Step a fraction of a step by partially activating two neighboring coils. Step size is determined
    by ``microsteps`` constructor argument."""
 
+def _duty_regs(value):
+    """The (on, off) LED register pair for a 16 bit duty cycle."""
+    if value == 0xffff:
+        return (0x1000, 0)
+    # Shift our value by four because the PCA9685 is only 12 bits but our value is 16
+    return (0, (value + 1) >> 4)
+
+class RecordingI2C:
+    """
+    A stand-in for ``busio.I2C`` with one PCA9685-like device behind it.
+    Keeps a 256 byte register file (with auto-increment) so register reads
+    work, and records every write transaction as ``(address, bytes)``
+    in ``transactions``. Pass it as ``PlotterKit(i2c=RecordingI2C())``
+    to count bus traffic without hardware.
+    """
+    def __init__(self):
+        self.regs = bytearray(256)
+        self.transactions = []
+
+    def try_lock(self):
+        return True
+
+    def unlock(self):
+        pass
+
+    def writeto(self, address, buffer, *, start=0, end=None):
+        data = bytes(buffer[start:end])
+        self.transactions.append((address, data))
+        if len(data) > 1:
+            self.regs[data[0]:data[0] + len(data) - 1] = data[1:]
+
+    def readfrom_into(self, address, buffer, *, start=0, end=None):
+        end = len(buffer) if end is None else end
+        buffer[start:end] = bytes(end - start)
+
+    def writeto_then_readfrom(self, address, buffer_out, buffer_in, *,
+                              out_start=0, out_end=None, in_start=0, in_end=None):
+        reg = buffer_out[out_start]
+        in_end = len(buffer_in) if in_end is None else in_end
+        buffer_in[in_start:in_end] = self.regs[reg:reg + in_end - in_start]
+
+    def clear(self):
+        """Forget the recorded transactions."""
+        self.transactions = []
+
 class PWMChannel:
     """A single PCA9685 channel that matches the :py:class:`~pulseio.PWMOut` API."""
     def __init__(self, pca, index):
@@ -60,12 +107,7 @@ class PWMChannel:
         if not 0 <= value <= 0xffff:
             raise ValueError("Out of range")
 
-        if value == 0xffff:
-            self._pca.pwm_regs[self._index] = (0x1000, 0)
-        else:
-            # Shift our value by four because the PCA9685 is only 12 bits but our value is 16
-            value = (value + 1) >> 4
-            self._pca.pwm_regs[self._index] = (0, value)
+        self._pca.write_channels(self._index, [_duty_regs(value)])
 
 class PCAChannels: # pylint: disable=too-few-public-methods
     """Lazily creates and caches channel objects as needed. Treat it like a sequence."""
@@ -109,6 +151,21 @@ class PCA9685:
         """Reset the chip."""
         self.mode1_reg = 0x00 # Mode1
 
+    def write_channels(self, first, regs):
+        """
+        Writes (on, off) register pairs to consecutive channels starting at
+        ``first`` in a single auto-increment I2C transaction.
+        Auto-increment is switched on by setting ``frequency``.
+        """
+        if len(regs) == 1:
+            self.pwm_regs[first] = regs[0]
+            return
+        buf = bytearray(1 + 4 * len(regs))
+        buf[0] = 0x06 + 4 * first
+        struct.pack_into('<' + 'HH' * len(regs), buf, 1, *[v for reg in regs for v in reg])
+        with self.i2c_device as i2c:
+            i2c.write(buf)
+
     @property
     def frequency(self):
         """The overall PWM frequency in Hertz."""
@@ -144,6 +201,7 @@ class Servo:
            for the given ``min_pulse`` and ``max_pulse`` values.
        :param int min_pulse: The minimum pulse width of the servo in microseconds.
        :param int max_pulse: The maximum pulse width of the servo in microseconds.
+       :param float frequency: The PWM frequency the servo channel runs at.
        ``actuation_range`` is an exposed property and can be changed at any time:
         .. code-block:: python
           servo = Servo(pwm)
@@ -160,15 +218,17 @@ class Servo:
          the servo mechanism may hit the end stops, buzz, and draw extra current as it stalls.
          Test carefully to find the safe minimum and maximum.
     """
-    def __init__(self, pwm_out, *, actuation_range=180, min_pulse=750, max_pulse=2250):
+    def __init__(self, pwm_out, *, actuation_range=180, min_pulse=750, max_pulse=2250,
+                 frequency=SERVO_FREQ):
         self._pwm_out = pwm_out
+        self._frequency = frequency
         self.actuation_range = actuation_range
         self.set_pulse_width_range(min_pulse, max_pulse)
 
     def set_pulse_width_range(self, min_pulse=750, max_pulse=2250):
         """Change min and max pulse widths."""
-        self._min_duty = int((min_pulse * SERVO_FREQ) / 1000000 * 0xffff)
-        max_duty = (max_pulse * SERVO_FREQ) / 1000000 * 0xffff
+        self._min_duty = int((min_pulse * self._frequency) / 1000000 * 0xffff)
+        max_duty = (max_pulse * self._frequency) / 1000000 * 0xffff
         self._duty_range = int(max_duty - self._min_duty)
 
     @property
@@ -223,6 +283,10 @@ class StepperMotor:
     def __init__(self, ain1, ain2, bin1, bin2, *, microsteps=8, power_fraction = 0.8):
         self.steps_per_rev = 200
         self._coil = (ain2, bin1, ain1, bin2)
+        # Channels in register order so one burst can energize all four coils.
+        self._order = sorted(range(4), key=lambda i: self._coil[i]._index)
+        self._first = self._coil[self._order[0]]._index
+        self._burst = [self._coil[i]._index for i in self._order] == list(range(self._first, self._first + 4))
         # set a safe pwm freq for each output
         for i in range(4):
             if self._coil[i].frequency < 1500:
@@ -235,9 +299,19 @@ class StepperMotor:
         self._microsteps = microsteps
         self._curve = [int(round(0xffff * power_fraction * math.sin(math.pi / (2 * microsteps) * i)))
                        for i in range(microsteps + 1)]
+        # Register values of the four coils (in register order) for each microstep of a cycle.
+        self._table = []
+        for microstep in range(4 * microsteps):
+            self._current_microstep = microstep
+            duty_cycles = self._duty_cycles()
+            self._table.append(tuple(_duty_regs(duty_cycles[i]) for i in self._order))
+        self._current_microstep = 0
+        # What was last written to each coil in register order (None if unknown).
+        self._written = [None] * 4
         self._update_coils()
 
-    def _update_coils(self, *, microstepping=False):
+    def _duty_cycles(self):
+        """The four coil duty cycles for the current microstep."""
         duty_cycles = [0, 0, 0, 0]
         trailing_coil = (self._current_microstep // self._microsteps) % 4
         leading_coil = (trailing_coil + 1) % 4
@@ -252,23 +326,57 @@ class StepperMotor:
         #                           duty_cycles[leading_coil] > 0):
         #     duty_cycles[leading_coil] = 0xffff
         #     duty_cycles[trailing_coil] = 0xffff
+        return duty_cycles
 
-        # Energize coils as appropriate:
-        for i in range(4):
-            self._coil[i].duty_cycle = duty_cycles[i]
+    def _coil_regs(self):
+        """(first channel, ((on, off), ...)) for the current microstep in register order."""
+        return self._first, self._table[self._current_microstep % len(self._table)]
+
+    def _changed(self):
+        """The (lo, hi) span in register order of coils whose value would change, or None."""
+        regs = self._table[self._current_microstep % len(self._table)]
+        changed = [i for i in range(4) if regs[i] != self._written[i]]
+        if not changed:
+            return None
+        return changed[0], changed[-1] + 1
+
+    def _update_coils(self, *, microstepping=False):
+        # Energize coils as appropriate, only writing the ones that change:
+        span = self._changed()
+        if span is None:
+            return
+        lo, hi = span
+        first, regs = self._coil_regs()
+        if self._burst:
+            self._coil[0]._pca.write_channels(first + lo, regs[lo:hi])
+        else:
+            for i in range(lo, hi):
+                if regs[i] != self._written[i]:
+                    coil = self._coil[self._order[i]]
+                    coil._pca.write_channels(coil._index, [regs[i]])
+        self._written[lo:hi] = regs[lo:hi]
 
     def release(self):
         """Releases all the coils so the motor can free spin, also won't use any power"""
         # De-energize coils:
         for i in range(4):
             self._coil[i].duty_cycle = 0
+        self._written = [_duty_regs(0)] * 4
 
     def onestep(self, *, direction=FORWARD, style=SINGLE):
+        """Steps and energizes the coils. See `advance`."""
+        self.advance(direction=direction, style=style)
+        # Now that we know our target microstep we can determine how to energize the four coils.
+        self._update_coils(microstepping=style == MICROSTEP)
+        return self._current_microstep
+
+    def advance(self, *, direction=FORWARD, style=SINGLE):
         """Performs one step of a particular style. The actual rotation amount will vary by style.
            `SINGLE` and `DOUBLE` will normal cause a full step rotation. `INTERLEAVE` will normally
            do a half step rotation. `MICROSTEP` will perform the smallest configured step.
            When step styles are mixed, subsequent `SINGLE`, `DOUBLE` or `INTERLEAVE` steps may be
            less than normal in order to align to the desired style's pattern.
+           Only moves the microstep counter, nothing is written to the coils.
            :param int direction: Either `FORWARD` or `BACKWARD`
            :param int style: `SINGLE`, `DOUBLE`, `INTERLEAVE`"""
         # Adjust current steps based on the direction and type of step.
@@ -301,8 +409,6 @@ class StepperMotor:
             self._current_microstep += step_size
         else:
             self._current_microstep -= step_size
-        # Now that we know our target microstep we can determine how to energize the four coils.
-        self._update_coils(microstepping=style == MICROSTEP)
         return self._current_microstep
 
 class PlotterKit:
@@ -310,27 +416,44 @@ class PlotterKit:
     A flatter structure which re-uses the PCA9685 object
     and moves the frequency around to take advantage of steppers and
     servos at the same time to provide the pen lifter.
+
+    Each change of frequency costs ~15ms. Passing shared_freq
+    (ie: SHARED_FREQ) runs both at one frequency so the prescaler
+    is programmed once and never switched.
+    mode_switches and mode_switch_time count what switching cost.
     """
-    def __init__(self, address=0x60, i2c=None, steppers_microsteps=8):
+    def __init__(self, address=0x60, i2c=None, steppers_microsteps=8, shared_freq=None):
         self._stepper1 = None
         self._stepper2 = None
         self._servo = None
         if i2c is None:
+            # Only on the pi, so RecordingI2C works anywhere.
+            import board
             i2c = board.I2C()
         self._pca = PCA9685(i2c, address=address)
         self.mode = 'stepper'
         self.stepper_freq = STEPPER_FREQ
-        self._pca.frequency = self.stepper_freq
         self.servo_freq = SERVO_FREQ
+        if shared_freq is not None:
+            self.stepper_freq = shared_freq
+            self.servo_freq = shared_freq
+        self._pca.frequency = self.stepper_freq
         self._steppers_microsteps = steppers_microsteps
+        self.mode_switches = 0
+        self.mode_switch_time = 0.
 
     def switch_mode(self, mode):
-        if (mode == 'servo' and self.mode != 'servo'):
-            self._pca.frequency = self.servo_freq
-            self.mode = 'servo'
-        if (mode == 'stepper' and self.mode != 'stepper'):
-            self._pca.frequency = self.stepper_freq
-            self.mode = 'stepper'
+        if mode == self.mode:
+            return
+        if self.stepper_freq != self.servo_freq:
+            t0 = time.time()
+            if (mode == 'servo'):
+                self._pca.frequency = self.servo_freq
+            else:
+                self._pca.frequency = self.stepper_freq
+            self.mode_switches += 1
+            self.mode_switch_time += time.time() - t0
+        self.mode = mode
 
     def release(self):
         self.switch_mode('stepper')
@@ -343,7 +466,8 @@ class PlotterKit:
         if (self.mode == 'stepper'):
             self.switch_mode('servo')
         if not self._servo:
-            self._servo = Servo(self._pca.channels[15], actuation_range=160, min_pulse=750, max_pulse=2250)
+            self._servo = Servo(self._pca.channels[15], actuation_range=160, min_pulse=750, max_pulse=2250,
+                                frequency=self._pca.frequency)
         return self._servo
 
     @property
@@ -366,7 +490,6 @@ class PlotterKit:
         if (self.mode == 'servo'):
             self.switch_mode('stepper')
         if not self._stepper1:
-            from adafruit_motor import stepper
             self._pca.channels[8].duty_cycle = 0xffff
             self._pca.channels[13].duty_cycle = 0xffff
             self._stepper1 = StepperMotor(self._pca.channels[10], self._pca.channels[9],
@@ -394,7 +517,6 @@ class PlotterKit:
         if (self.mode == 'servo'):
             self.switch_mode('stepper')
         if not self._stepper2:
-            from adafruit_motor import stepper
             self._pca.channels[7].duty_cycle = 0xffff
             self._pca.channels[2].duty_cycle = 0xffff
             self._stepper2 = StepperMotor(self._pca.channels[4], self._pca.channels[3],
@@ -0,0 +1,67 @@
+"""
+Pieces of the headless simulated plotter, Plotter(sim=True).
+
+The simulated plotter runs the real plotting code against mock
+steppers and a lifter driven by a virtual clock (plotter.timeclass)
+so a job takes as long as the python does, not the motors,
+while its timing stays step accurate.
+Its logs are RingLogs, fixed size numpy buffers, and its
+pen trace can be rendered to a png with render_trace().
+"""
+import numpy as np
+
+class RingLog:
+    def __init__(self, capacity=1<<16, width=2):
+        """
+        Keeps the last capacity rows of width floats.
+        append() takes a row like list.append did.
+        """
+        self.buf = np.zeros((capacity, width))
+        self.capacity = capacity
+        self.n = 0 # rows ever appended.
+    def append(self, row):
+        self.buf[self.n % self.capacity] = row
+        self.n += 1
+    def clear(self):
+        self.n = 0
+    def __len__(self):
+        return min(self.n, self.capacity)
+    def array(self):
+        """
+        The kept rows, oldest first.
+        """
+        if (self.n <= self.capacity):
+            return self.buf[:self.n].copy()
+        K = self.n % self.capacity
+        return np.concatenate([self.buf[K:], self.buf[:K]], 0)
+
+def render_trace(trace, filename, x_lim=None, y_lim=None, dpi=150, width=0.3):
+    """
+    Renders a pen trace to a png.
+
+    Args:
+        trace: (n,4) rows of (time, x, y, pen) logged after each
+            move, pen being the Lifter state during it (0 down, 1 up).
+        x_lim, y_lim: the plot area, drawn as a box.
+    """
+    # A bare Figure, so the notebook's pyplot backend is left alone.
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.collections import LineCollection
+    trace = np.asarray(trace).reshape(-1,4)
+    down = trace[1:,3] == 0
+    segs = np.stack([trace[:-1,1:3], trace[1:,1:3]], 1)[down]
+    fig = Figure(figsize=(8,6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1,1,1)
+    ax.add_collection(LineCollection(segs, colors='k', linewidths=width))
+    if (x_lim is not None and y_lim is not None):
+        ax.plot([x_lim[0], x_lim[1], x_lim[1], x_lim[0], x_lim[0]],
+                [y_lim[0], y_lim[0], y_lim[1], y_lim[1], y_lim[0]], 'r:', lw=0.5)
+    ax.autoscale_view()
+    ax.set_aspect('equal')
+    # y grows downwards on the wall.
+    ax.invert_yaxis()
+    ax.axis('off')
+    fig.savefig(filename, dpi=dpi, bbox_inches='tight')
+    return int(down.sum())
@@ -0,0 +1,97 @@
+"""
+Smoothing of (n,2) paths in linear time.
+
+moving_average() is lineifiers.smooth_path: each vertex is the mean
+of the window vertices before it (not itself), with its odd edges
+kept exactly, but from cumulative sums instead of a mean per vertex.
+gaussian() and savgol() are centered alternatives, without the lag
+of the trailing mean. halving() is lineifiers.smooth_path0.
+"""
+import numpy as np
+
+def moving_average(path, window=400):
+    """
+    Trailing moving average, same output as the original smooth_path:
+        out[0] = path[0]
+        out[K] = path[K-window:K].mean(0)
+    with python's negative slice starts, ie: when len(path) >= window
+    the first window vertices are kept, when it's shorter
+    vertex K averages path[max(0,n+K-window):K].
+    """
+    path = np.asarray(path, dtype=np.float64)
+    n = path.shape[0]
+    if (n < 2 or window <= 0):
+        return path.copy()
+    # Centered cumulative sums lose less precision on long paths.
+    mu = path.mean(0)
+    cs = np.empty((n+1,)+path.shape[1:])
+    cs[0] = 0.
+    np.cumsum(path-mu, 0, out=cs[1:])
+    tore = np.empty_like(path)
+    # Full windows, path[K-window:K] for K >= window.
+    if (n > window):
+        tore[window:] = (cs[window:n]-cs[:n-window])/window + mu
+    # The first vertices, with python's negative slice starts.
+    K = np.arange(1, min(window, n))
+    start = np.maximum(K - window + n, 0)
+    # Empty slices (start >= K) keep the vertex.
+    keep = start >= K
+    start = np.where(keep, K-1, start)
+    tore[0] = path[0]
+    tore[K] = (cs[K]-cs[start])/(K-start).reshape((-1,)+(1,)*(path.ndim-1)) + mu
+    tore[K[keep]] = path[K[keep]]
+    return tore
+
+def gaussian(path, sigma=20.):
+    """
+    Centered gaussian smoothing, ends held (mode nearest).
+    """
+    from scipy import ndimage
+    return ndimage.gaussian_filter1d(np.asarray(path, dtype=np.float64), sigma,
+                                     axis=0, mode='nearest')
+
+def savgol(path, window=41, order=3):
+    """
+    Savitzky-Golay smoothing: local polynomial fits of
+    the given order over (odd) window vertices.
+    Keeps corners and curvature better than a mean.
+    """
+    from scipy import signal
+    path = np.asarray(path, dtype=np.float64)
+    window = min(window, path.shape[0])
+    window -= 1 - window % 2
+    if (window <= order):
+        return path.copy()
+    return signal.savgol_filter(path, window, order, axis=0, mode='interp')
+
+def halving(path, iters=400):
+    """
+    The original smooth_path0: iters passes of
+        new[I] = (new[I-1] + path[I+1])/2
+    between the kept first and last vertices. Each pass drops
+    a vertex, as it always did. A pass is one lfilter call.
+    """
+    from scipy import signal
+    path = np.asarray(path, dtype=np.float64)
+    for iter in range(iters):
+        if (path.shape[0] <= 3):
+            path = np.stack([path[0], path[-1]], 0)
+            continue
+        mid = signal.lfilter([0.5], [1., -0.5], path[2:-1], axis=0,
+                             zi=0.5*path[0:1])[0]
+        path = np.concatenate([path[:1], mid, path[-1:]], 0)
+    return path
+
+def smooth(path, window=400, method='mean'):
+    """
+    Args:
+        method: 'mean' (moving_average), 'gaussian' (sigma window/6)
+            or 'savgol' (cubic over window vertices)
+    """
+    if (method == 'mean'):
+        return moving_average(path, window)
+    if (method == 'gaussian'):
+        return gaussian(path, window/6.)
+    if (method == 'savgol'):
+        return savgol(path, window)
+    raise Exception("Unknown smoothing: "+method)
@@ -0,0 +1,275 @@
+"""
+Compiles xy vertices into flat arrays of motor step events
+so the plotter can replay a whole path without doing any
+geometry between steps.
+
+A step plan is an (n,2) int8 array. Each row is one step
+event (dL, dR) with exactly one non-zero entry of +-1, in the
+same order Plotter.move_to would issue them.
+
+The functions here take a 'machine', anything with the
+attributes cog_distance, L0, R0, step_dl, x_lim and y_lim
+(ie: a Plotter, or a Geometry when there is no hardware).
+"""
+from math import pi
+import numpy as np
+
+class Geometry:
+    def __init__(self, cog_distance = 80.5,
+                    bottom_edge = 48.0,
+                    steps_per_rev=400, cog_circum=1.5*2*pi,
+                    y0 = 13., x_pad = 18., y_pad = 10.
+                  ):
+        """
+        The machine geometry of Plotter.initialize()
+        without any hardware. Same arguments and defaults.
+        """
+        self.cog_distance = cog_distance
+        self.bottom_edge = bottom_edge
+        self.steps_per_rev = steps_per_rev
+        self.cog_circum = cog_circum
+        self.x0 = cog_distance/2.
+        self.y0 = y0
+        self.x_lim = (x_pad, cog_distance - x_pad)
+        self.y_lim = (y_pad, bottom_edge - y_pad)
+        self.L0, self.R0 = xy_to_LR([self.x0, self.y0], cog_distance)[0].tolist()
+        self.step_dl = cog_circum/steps_per_rev
+
+def xy_to_LR(xy, cog_distance):
+    """
+    Vectorized Plotter.xy_to_LR over an (n,2) array.
+    """
+    xy = np.asarray(xy, dtype=np.float64).reshape(-1,2)
+    x = xy[:,0]
+    y = xy[:,1]
+    return np.stack([np.sqrt(x*x+y*y),
+                     np.sqrt(np.power(cog_distance-x,2.0)+y*y)],-1)
+
+def LR_to_xy(LR, cog_distance):
+    """
+    Inverse of xy_to_LR, over an (n,2) array.
+    """
+    LR = np.asarray(LR, dtype=np.float64).reshape(-1,2)
+    L = LR[:,0]
+    R = LR[:,1]
+    x = (L*L - R*R + cog_distance*cog_distance)/(2.*cog_distance)
+    return np.stack([x, np.sqrt(np.maximum(L*L - x*x, 0.))], -1)
+
+def clamp_xy(xy, x_lim, y_lim):
+    """
+    Clamps vertices into the plot area like move_to does.
+    Returns the clamped array and the number of vertices
+    that were out of bounds.
+    """
+    xy = np.asarray(xy, dtype=np.float64).reshape(-1,2)
+    lo = np.array([x_lim[0], y_lim[0]])
+    hi = np.array([x_lim[1], y_lim[1]])
+    oob = np.logical_or(xy<lo, xy>hi).any(-1)
+    return np.clip(xy, lo, hi), int(oob.sum())
+
+def aspect(cbds):
+    """
+    Width over height of bounds cbds, inf for a
+    horizontal line and 1 for a point.
+    """
+    x_dim = cbds[2]-cbds[0]
+    y_dim = cbds[3]-cbds[1]
+    if (y_dim == 0):
+        return float('inf') if x_dim else 1.
+    return x_dim/y_dim
+
+def scale_transform(machine, cbds, reduction = 1.0):
+    """
+    scale_fac, Shift so that xy*scale_fac + Shift
+    fits data with bounds cbds into the plot area.
+    (A single point is centered, unscaled.)
+    """
+    x_lim, y_lim = machine.x_lim, machine.y_lim
+    x_dim = cbds[2]-cbds[0]
+    y_dim = cbds[3]-cbds[1]
+    c_paths = [(cbds[2]+cbds[0])/2., (cbds[3]+cbds[1])/2.]
+    ar_paths = aspect(cbds)
+    ar_self = (x_lim[1]-x_lim[0])/(y_lim[1]-y_lim[0])
+    if (x_dim == 0 and y_dim == 0):
+        scale_fac = reduction
+    elif ar_paths < ar_self:
+        # y is the limiting.
+        scale_fac = abs(.99*(y_lim[1]-y_lim[0])/y_dim)*reduction
+    else:
+        scale_fac = abs(.99*(x_lim[1]-x_lim[0])/x_dim)*reduction
+    origin_shift = np.array([[c_paths[0],c_paths[1]]])
+    Pc = np.array([[(x_lim[1]+x_lim[0])/2, (y_lim[1]+y_lim[0])/2]])
+    Shift = Pc - scale_fac*origin_shift
+    return scale_fac, Shift
+
+def step_targets(machine, xy):
+    """
+    L,R lengths of xy and the (stepsum_L, stepsum_R) nearest them.
+    """
+    LR0 = np.array([machine.L0, machine.R0])
+    LR = xy_to_LR(xy, machine.cog_distance)
+    return LR, np.rint((LR - LR0)/machine.step_dl).astype(np.int64)
+
+def interleave(d, n):
+    """
+    The move_to interleave for many segments at once.
+
+    Args:
+        d: (m,2) float L,R length changes of each segment.
+        n: (m,2) int signed L,R step counts of each segment.
+    Returns:
+        steps: (N,2) int8 step events.
+        ends: (m,) offsets in steps where each segment ends.
+    """
+    d = np.asarray(d, dtype=np.float64).reshape(-1,2)
+    n = np.asarray(n, dtype=np.int64).reshape(-1,2)
+    nL = np.abs(n[:,0])
+    nR = np.abs(n[:,1])
+    tot = nL + nR
+    ends = np.cumsum(tot)
+    starts = ends - tot
+    steps = np.zeros((int(ends[-1]) if len(ends) else 0, 2), dtype=np.int8)
+    # Everything is an L step, except the R steps placed below.
+    steps[:,0] = np.repeat(np.sign(n[:,0]), tot)
+    # R step k (0 based) comes after min(nL, floor(k*slope)) L steps.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(d[:,1] != 0, np.abs(d[:,0])/np.abs(d[:,1]), 0.)
+    seg = np.repeat(np.arange(len(n)), nR)
+    k = np.arange(len(seg)) - np.repeat(np.cumsum(nR) - nR, nR)
+    n_before = np.minimum(nL[seg], np.floor(k*slope[seg]).astype(np.int64))
+    pos = starts[seg] + k + n_before
+    steps[pos,0] = 0
+    steps[pos,1] = np.sign(n[seg,1])
+    return steps, ends
+
+def compile_vertices(machine, vertices, start=(0,0), raw=False):
+    """
+    Compiles the moves from the step position start=(stepsum_L, stepsum_R)
+    through every vertex.
+    Matches a sequence of move_to calls, except possibly at exact
+    half-step ties where move_to's rounding depends on float noise.
+
+    Returns:
+        steps: (N,2) int8 step events.
+        ends: (len(vertices),) step offsets where each move ends.
+        n_oob: number of vertices clamped into the plot area.
+    """
+    xy = np.asarray(vertices, dtype=np.float64).reshape(-1,2)
+    n_oob = 0
+    if (not raw):
+        xy, n_oob = clamp_xy(xy, machine.x_lim, machine.y_lim)
+    LR, target = step_targets(machine, xy)
+    prev = np.concatenate([np.array([start], dtype=np.int64), target[:-1]], 0)
+    d = LR - (np.array([machine.L0, machine.R0]) + prev*machine.step_dl)
+    steps, ends = interleave(d, target - prev)
+    return steps, ends, n_oob
+
+def compile_paths(machine, paths, start=(0,0), raw=False):
+    """
+    Compiles a whole list of paths, as draw_vertices would draw
+    them one after another, into one plan.
+
+    Returns:
+        steps: (N,2) int8 step events.
+        pen: (k,2) int64 rows of (step offset, lifter state) which
+             should be applied before replaying that step.
+             State is 1 for up and 0 for down as in Lifter.
+        n_oob: number of vertices clamped into the plot area.
+    """
+    paths = [p for p in paths if len(p)>=2]
+    if (len(paths)==0):
+        return np.zeros((0,2), dtype=np.int8), np.zeros((0,2), dtype=np.int64), 0
+    lengths = np.array([len(p) for p in paths])
+    xy = np.concatenate([np.asarray(p, dtype=np.float64).reshape(-1,2) for p in paths], 0)
+    steps, ends, n_oob = compile_vertices(machine, xy, start, raw)
+    first = np.cumsum(lengths) - lengths
+    ups = np.where(first>0, ends[first-1], 0)
+    downs = ends[first]
+    pen = np.zeros((2*len(paths)+1, 2), dtype=np.int64)
+    pen[0:-1:2,0] = ups
+    pen[0:-1:2,1] = 1
+    pen[1:-1:2,0] = downs
+    pen[-1] = [len(steps), 1]
+    return steps, pen, n_oob
+
+def estimate(machine, paths, start=(0,0), step_delay=0.05, lift_delay=0.3,
+             planner=None):
+    """
+    Predicts what drawing paths (already scaled into the
+    plot area) with draw_vertices costs, without compiling
+    any steps.
+
+    Args:
+        machine: Plotter or Geometry.
+        start: (stepsum_L, stepsum_R) the pen starts at.
+        step_delay: JStepper.step_delay
+        lift_delay: Lifter.step_delay
+        planner: optional motion.MotionPlanner, if the steps are timed by one.
+    Returns:
+        dict of counts and predicted seconds.
+    """
+    paths = [p for p in paths if len(p)>=2]
+    tore = {'paths': len(paths), 'vertices': 0, 'steps_L': 0, 'steps_R': 0,
+            'travel_steps': 0, 'draw_steps': 0, 'pen_lifts': len(paths),
+            'seconds': 0., 'hours': 0.}
+    if (len(paths)==0):
+        return tore
+    lengths = np.array([len(p) for p in paths])
+    xy = np.concatenate([np.asarray(p, dtype=np.float64).reshape(-1,2) for p in paths], 0)
+    xy, _ = clamp_xy(xy, machine.x_lim, machine.y_lim)
+    _, target = step_targets(machine, xy)
+    prev = np.concatenate([np.array([start], dtype=np.int64), target[:-1]], 0)
+    n = np.abs(target - prev)
+    per_move = n.sum(-1)
+    first = np.cumsum(lengths) - lengths
+    travel = per_move[first].sum()
+    total = per_move.sum()
+    tore['vertices'] = int(len(xy))
+    tore['steps_L'] = int(n[:,0].sum())
+    tore['steps_R'] = int(n[:,1].sum())
+    tore['travel_steps'] = int(travel)
+    tore['draw_steps'] = int(total - travel)
+    if (planner is None):
+        step_seconds = total*step_delay
+    else:
+        # All the paths in one plan: the pen stops before
+        # travelling to a path and before drawing it.
+        LR0 = np.array([machine.L0, machine.R0])
+        start_xy = LR_to_xy(LR0 + np.asarray(start)*machine.step_dl, machine.cog_distance)
+        stops = np.zeros(len(xy), dtype=bool)
+        stops[first] = True
+        stops[first+1] = True
+        step_seconds = planner(start_xy, xy, per_move, stops).sum()
+    # Each path lowers and raises the pen once.
+    tore['seconds'] = float(step_seconds + 2*len(paths)*lift_delay)
+    tore['hours'] = tore['seconds']/3600.
+    return tore
+
+def end_steps(machine, xy, raw=False):
+    """
+    (stepsum_L, stepsum_R) after moving to the vertex xy.
+    """
+    xy = np.asarray(xy, dtype=np.float64).reshape(-1,2)
+    if (not raw):
+        xy, _ = clamp_xy(xy, machine.x_lim, machine.y_lim)
+    return tuple(step_targets(machine, xy)[1][0].tolist())
+
+def chunks(paths, size=100000):
+    """
+    Batches an iterable of paths into lists of about size
+    vertices, dropping paths with < 2 vertices, so a job can
+    be compiled or estimated without holding all of it.
+    """
+    batch = []
+    n = 0
+    for path in paths:
+        if (len(path)<2):
+            continue
+        batch.append(path)
+        n += len(path)
+        if (n >= size):
+            yield batch
+            batch = []
+            n = 0
+    if (len(batch)>0):
+        yield batch
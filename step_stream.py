@@ -0,0 +1,207 @@
+"""
+Precompiled step streams (.pgs), made on the desktop
+and replayed by Plotter.play_stream without any geometry.
+
+compile_file() does what pre_process and plot_file do on the pi:
+scheduling, rotation, scaling and the move_to interleave,
+for a step_plan.Geometry, and writes the result as
+run-length encoded uint16 records: op << 13 | count.
+
+    op 0..3: count (1..8191) steps of L+, L-, R+, R-
+    op 4:    pen, count is the Lifter state (1 up, 0 down)
+    op 5:    new channel, count is its index (load a pen, re-home)
+
+Each channel is compiled from the home position (stepsum 0,0)
+since the plotter re-homes (init_pen) for every pen.
+The header holds a hash of the geometry, and a stream compiled
+for another machine is refused.
+
+usage: python3 step_stream.py job.pkl [-o job.pgs] [--budget 10]
+          [--cog_distance 80.5 --bottom_edge 48. ...]
+(or python3 plotter.py compile job.pkl ...)
+"""
+import hashlib, struct, sys
+import numpy as np
+import step_plan, path_planning, path_file
+
+MAGIC = b'PGSTEP1\0'
+HEADER = struct.Struct('<8s16sddIIqq')
+COUNT_BITS = 13
+MAX_COUNT = (1<<COUNT_BITS)-1
+OP_PEN = 4
+OP_CHANNEL = 5
+CHANNEL_NAMES = ["Cyan", "Yellow", "Magenta", "Black"]
+
+def geometry_hash(machine):
+    """
+    16 byte digest of everything a compiled stream depends on.
+    """
+    values = np.round([machine.cog_distance, machine.L0, machine.R0,
+                       machine.step_dl, machine.x_lim[0], machine.x_lim[1],
+                       machine.y_lim[0], machine.y_lim[1]], 9)
+    return hashlib.blake2b(values.astype('<f8').tobytes(), digest_size=16).digest()
+
+def encode(steps, pen):
+    """
+    Run-length encodes compiled steps and pen events
+    (see step_plan.compile_paths) into uint16 records.
+    """
+    steps = np.asarray(steps)
+    N = len(steps)
+    code = np.where(steps[:,0]>0, 0, np.where(steps[:,0]<0, 1,
+                    np.where(steps[:,1]>0, 2, 3)))
+    brk = np.zeros(N+1, dtype=bool)
+    brk[0] = True
+    brk[1:N] = code[1:] != code[:-1]
+    # Runs also break where the pen moves.
+    brk[pen[:,0]] = True
+    starts = np.flatnonzero(brk[:N])
+    lengths = np.diff(np.concatenate([starts, [N]]))
+    # Split runs longer than a record holds.
+    pieces = (lengths + MAX_COUNT - 1)//MAX_COUNT
+    run = np.repeat(np.arange(len(starts)), pieces)
+    j = np.arange(len(run)) - np.repeat(np.cumsum(pieces)-pieces, pieces)
+    counts = np.minimum(lengths[run] - j*MAX_COUNT, MAX_COUNT)
+    offsets = np.concatenate([starts[run] + j*MAX_COUNT, pen[:,0]])
+    records = np.concatenate([(code[starts[run]] << COUNT_BITS) | counts,
+                              (OP_PEN << COUNT_BITS) | pen[:,1]])
+    # Pen events go before the steps at the same offset.
+    first = np.concatenate([np.ones(len(run), dtype=np.int64),
+                            np.zeros(len(pen), dtype=np.int64)])
+    return records[np.lexsort((first, offsets))].astype('<u2')
+
+def decode(records):
+    """
+    (ops, counts) of uint16 records.
+    """
+    records = np.asarray(records, dtype=np.uint16)
+    return records >> COUNT_BITS, records & MAX_COUNT
+
+def write_stream(filename, machine, channels):
+    """
+    Writes the records of each channel (see encode).
+    """
+    body = []
+    n_steps = 0
+    for C, records in enumerate(channels):
+        body.append(np.array([(OP_CHANNEL << COUNT_BITS) | C], dtype='<u2'))
+        body.append(records)
+        ops, counts = decode(records)
+        n_steps += int(counts[ops<4].sum())
+    body = np.concatenate(body).astype('<u2')
+    with open(filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, geometry_hash(machine), machine.cog_distance,
+                            machine.step_dl, len(channels), 0, len(body), n_steps))
+        f.write(body.tobytes())
+    return filename
+
+def is_stream_file(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def read_stream(filename, machine=None):
+    """
+    Returns the header as a dict and the (memory mapped) records.
+    Raises if machine is given and its geometry isn't
+    the one the stream was compiled for.
+    """
+    with open(filename, 'rb') as f:
+        head = f.read(HEADER.size)
+    magic, ghash, cog_distance, step_dl, n_channels, _, n_records, n_steps = HEADER.unpack(head)
+    if (magic != MAGIC):
+        raise Exception("Not a step stream: "+filename)
+    if (machine is not None and ghash != geometry_hash(machine)):
+        raise Exception("Stream compiled for another geometry (cog_distance {} step_dl {})"
+                        " than this plotter (cog_distance {} step_dl {})".format(
+                        cog_distance, step_dl, machine.cog_distance, machine.step_dl))
+    info = {'cog_distance': cog_distance, 'step_dl': step_dl,
+            'channels': n_channels, 'records': n_records, 'steps': n_steps}
+    if (n_records == 0):
+        return info, np.zeros(0, dtype='<u2')
+    return info, np.memmap(filename, dtype='<u2', mode='r',
+                           offset=HEADER.size, shape=(n_records,))
+
+def compile_paths(machine, paths, cbds, rotate=False, budget=0.):
+    """
+    Schedules, rotates, scales and compiles one channel
+    of paths with bounds cbds from home into records.
+    """
+    paths = [np.asarray(p, dtype=np.float64) for p in paths if len(p)>=2]
+    if (len(paths)==0):
+        return np.zeros(0, dtype='<u2')
+    order, flip = path_planning.greedy_order(paths)
+    paths = path_planning.reorder(paths, order, flip)
+    if (rotate):
+        paths = [p[:,::-1]*np.array([[-1.,1.]]) for p in paths]
+        cbds = [-cbds[3], cbds[0], -cbds[1], cbds[2]]
+    scale_fac, Shift = step_plan.scale_transform(machine, cbds)
+    paths = [p*scale_fac + Shift for p in paths]
+    if (budget>0 and len(paths)>=3):
+        starts, ends = path_planning.path_ends(paths)
+        S = step_plan.xy_to_LR(starts, machine.cog_distance)/machine.step_dl
+        E = step_plan.xy_to_LR(ends, machine.cog_distance)/machine.step_dl
+        order, flip = path_planning.improve_order(S, E, budget)
+        paths = path_planning.reorder(paths, order, flip)
+    steps, pen, n_oob = step_plan.compile_paths(machine, paths)
+    if (n_oob>0):
+        print("oob vertices clamped: ", n_oob)
+    return encode(steps, pen)
+
+def compile_file(filename, outname=None, machine=None, budget=0.):
+    """
+    Compiles a pickled or .pgp job into a .pgs step stream.
+
+    Args:
+        machine: step_plan.Geometry (default Geometry())
+        budget: seconds to spend improving the path order.
+    """
+    if (machine is None):
+        machine = step_plan.Geometry()
+    if (outname is None):
+        outname = filename.rsplit('.',1)[0]+'.pgs'
+    if (path_file.is_path_file(filename)):
+        PF = path_file.PathFile(filename)
+        DATA, cymk = PF.data(), PF.cymk
+    else:
+        import pickle
+        with open(filename, 'rb') as f:
+            DATA = pickle.load(f)
+        cymk = path_file.is_cymk(DATA)
+    channels = DATA if cymk else [DATA]
+    pts = [np.asarray(p, dtype=np.float64).reshape(-1,2) for C in channels for p in C if len(p)>=2]
+    if (len(pts)==0):
+        print("No paths in", filename)
+        write_stream(outname, machine, [np.zeros(0, dtype='<u2') for C in channels])
+        return outname
+    pts = np.concatenate(pts, 0)
+    cbds = pts.min(0).tolist() + pts.max(0).tolist()
+    # Like plot_file, only mono jobs are rotated.
+    rotate = (not cymk) and step_plan.aspect(cbds) < 1
+    records = []
+    for C, paths in enumerate(channels):
+        records.append(compile_paths(machine, paths, cbds, rotate, budget/len(channels)))
+        print("channel", C, len(records[-1]), "records")
+    write_stream(outname, machine, records)
+    info, _ = read_stream(outname)
+    print("Wrote {} ({} steps in {} records)".format(outname, info['steps'], info['records']))
+    return outname
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="Compile a job into a step stream.")
+    parser.add_argument("filename")
+    parser.add_argument("-o", "--outname", default=None)
+    parser.add_argument("--budget", type=float, default=0.)
+    for name, value in [("cog_distance", 80.5), ("bottom_edge", 48.0),
+                        ("steps_per_rev", 400), ("y0", 13.),
+                        ("x_pad", 18.), ("y_pad", 10.)]:
+        parser.add_argument("--"+name, type=type(value), default=value)
+    args = parser.parse_args(argv)
+    machine = step_plan.Geometry(cog_distance=args.cog_distance,
+                                 bottom_edge=args.bottom_edge,
+                                 steps_per_rev=args.steps_per_rev, y0=args.y0,
+                                 x_pad=args.x_pad, y_pad=args.y_pad)
+    return compile_file(args.filename, args.outname, machine, args.budget)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
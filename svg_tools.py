@@ -115,63 +115,93 @@ def paths_bounds(paths):
     A = np.array(L)
     return A[:,:2].min(0).tolist()+A[:,2:].max(0).tolist()
 
+def path_segments(paths):
+    """
+    (n,4) array of the x0,y0,x1,y1 of the segments of
+    all the paths, leaving out the horizontal ones.
+    """
+    paths = [np.asarray(p, dtype=np.float64).reshape(-1,2) for p in paths if len(p)>=2]
+    if (len(paths)==0):
+        return np.zeros((0,4))
+    V = np.concatenate(paths, 0)
+    # No segments from the end of one path to the next.
+    within = np.ones(len(V)-1, dtype=bool)
+    within[np.cumsum([len(p) for p in paths])[:-1]-1] = False
+    S = np.concatenate([V[:-1], V[1:]], 1)[within]
+    return S[S[:,1] != S[:,3]]
+
+def scanline_crossings(segments, ys):
+    """
+    Where the scanlines ys (ascending) cross the segments.
+    A segment spans [its lower y, its upper y) so a vertex
+    on a scanline is crossed once.
+
+    Returns:
+        (lines, xs) indices into ys and x's, sorted by line then x.
+    """
+    lo = np.minimum(segments[:,1], segments[:,3])
+    hi = np.maximum(segments[:,1], segments[:,3])
+    i0 = np.searchsorted(ys, lo, 'left')
+    n = np.searchsorted(ys, hi, 'left') - i0
+    seg = np.repeat(np.arange(len(segments)), n)
+    lines = np.repeat(i0, n) + np.arange(len(seg)) - np.repeat(np.cumsum(n)-n, n)
+    x0, y0, x1, y1 = segments[seg].T
+    rise, run = y1-y0, x1-x0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = rise/run
+        xs = np.where(run == 0, x0, (ys[lines] - (y0 - slope*x0))/slope)
+    order = np.lexsort((xs, lines))
+    return lines[order], xs[order]
+
+def scanline_hatches(segments, ys_list, strict=True):
+    """
+    Horizontal hatches inside the segments (see path_segments)
+    along each array of scanlines in ys_list, all in one pass.
+
+    Args:
+        strict: raise if a scanline crosses an odd number of
+            times (an open path), else warn and drop its last crossing.
+    Returns:
+        a list of [[[x0,y],[x1,y]], ... ] for each of ys_list
+    """
+    ys_list = [np.asarray(ys, dtype=np.float64).reshape(-1) for ys in ys_list]
+    counts = [len(ys) for ys in ys_list]
+    if (sum(counts)==0 or len(segments)==0):
+        return [[] for ys in ys_list]
+    ys = np.concatenate(ys_list)
+    order = np.argsort(ys, kind='stable')
+    lines, xs = scanline_crossings(segments, ys[order])
+    # Back to the scanlines as given, in order.
+    lines = order[lines]
+    resort = np.lexsort((xs, lines))
+    lines, xs = lines[resort], xs[resort]
+    n = np.bincount(lines, minlength=len(ys))
+    if ((n % 2).any()):
+        print("WARNING ODD INT")
+        if (strict):
+            raise Exception('odd int')
+        last = np.cumsum(n)-1
+        keep = np.ones(len(xs), dtype=bool)
+        keep[last[n % 2 == 1]] = False
+        lines, xs = lines[keep], xs[keep]
+    y = ys[lines[0::2]]
+    hatches = np.stack([np.stack([xs[0::2], y], -1), np.stack([xs[1::2], y], -1)], 1)
+    splits = np.searchsorted(lines[0::2], np.cumsum(counts)[:-1])
+    return [H.tolist() for H in np.split(hatches, splits)]
+
 def interior_hatches(a_path, ys):
-    tore = []
-    for y in ys:
-        xs = []
-        for I,s in enumerate(a_path[:-1]):
-            s2 = a_path[I+1]
-            YS = sorted([s[1],s2[1]])
-            if y >= YS[0] and y <= YS[1]:
-                rise = (s2[1]-s[1])
-                run = (s2[0]-s[0])
-                if (rise == 0):
-                    continue
-                if (run == 0):
-                    xs.append(s[0])
-                    continue
-                slope = rise/run
-                int  = s[1] - slope*s[0]
-                x = (y-int)/slope
-                xs.append(x)
-        # Now sort the x's
-        SX = sorted(xs)
-        if (len(SX)%2==1):
-            print("WARNING ODD INT")
-        NS = len(SX)//2
-        for I in range(NS):
-            tore.append([[SX[2*I],y],[SX[2*I+1],y]])
-    return tore
+    return scanline_hatches(path_segments([a_path]), [ys], strict=False)[0]
 
 def interior_hatches_paths(paths, ys):
-    tore = []
-    for y in ys:
-        xs = []
-        for a_path in paths:
-            for I,s in enumerate(a_path[:-1]):
-                s2 = a_path[I+1]
-                YS = sorted([s[1],s2[1]])
-                if y >= YS[0] and y <= YS[1]:
-                    rise = (s2[1]-s[1])
-                    run = (s2[0]-s[0])
-                    if (rise == 0):
-                        continue
-                    if (run == 0):
-                        xs.append(s[0])
-                        continue
-                    slope = rise/run
-                    int  = s[1] - slope*s[0]
-                    x = (y-int)/slope
-                    xs.append(x)
-        # Now sort the x's
-        SX = sorted(xs)
-        if (len(SX)%2==1):
-            print("WARNING ODD INT")
-            raise Exception('odd int')
-        NS = len(SX)//2
-        for I in range(NS):
-            tore.append([[SX[2*I],y],[SX[2*I+1],y]])
-    return tore
+    return scanline_hatches(path_segments(paths), [ys])[0]
+
+def hatch_scanlines(bounds, cymk, linewidth):
+    """
+    The c,y,m,k scanlines: weight*height/linewidth of them.
+    """
+    xmin, ymin, xmax, ymax = bounds
+    ydist = ymax - ymin
+    return [np.linspace(ymin, ymax, int(ydist*W/linewidth)) for W in cymk[:4]]
 
 def hatch_paths_within_path(a_path, cymk, linewidth=2., slope = 0.):
     """
@@ -184,25 +214,14 @@ def hatch_paths_within_path(a_path, cymk, linewidth=2., slope = 0.):
         [c_paths, ... ]
         which you could append to cymk to get the desired hatching.
     """
-    xmin, ymin, xmax, ymax = path_bounds(a_path)
-    ydist = ymax - ymin
-    nc = ydist*cymk[0]/linewidth
-    ny = ydist*cymk[1]/linewidth
-    nm = ydist*cymk[2]/linewidth
-    nk = ydist*cymk[3]/linewidth
-    cys = np.linspace(ymin,ymax,nc)
-    chs = interior_hatches(a_path, cys)
-    yys = np.linspace(ymin,ymax,ny)
-    yhs = interior_hatches(a_path, yys)
-    mys = np.linspace(ymin,ymax,nm)
-    mhs = interior_hatches(a_path, mys)
-    kys = np.linspace(ymin,ymax,nk)
-    khs = interior_hatches(a_path, kys)
-    return [chs,yhs,mhs,khs]
+    return scanline_hatches(path_segments([a_path]),
+                            hatch_scanlines(path_bounds(a_path), cymk, linewidth),
+                            strict=False)
 
 def hatch_paths_within_paths(paths, cymk, linewidth=4., slope = 0.):
     """
     Creates horiz hatches in a curve.
+    The crossings of all four channels come from one pass.
 
     Args:
         a_path: a list of coordinate tuples
@@ -213,21 +232,8 @@ def hatch_paths_within_paths(paths, cymk, linewidth=4., slope = 0.):
     """
     if len(paths)<1:
         return [[],[],[],[]]
-    xmin, ymin, xmax, ymax = paths_bounds(paths)
-    ydist = ymax - ymin
-    nc = ydist*cymk[0]/linewidth
-    ny = ydist*cymk[1]/linewidth
-    nm = ydist*cymk[2]/linewidth
-    nk = ydist*cymk[3]/linewidth
-    cys = np.linspace(ymin,ymax,nc)
-    chs = interior_hatches_paths(paths, cys)
-    yys = np.linspace(ymin,ymax,ny)
-    yhs = interior_hatches_paths(paths, yys)
-    mys = np.linspace(ymin,ymax,nm)
-    mhs = interior_hatches_paths(paths, mys)
-    kys = np.linspace(ymin,ymax,nk)
-    khs = interior_hatches_paths(paths, kys)
-    return [chs,yhs,mhs,khs]
+    return scanline_hatches(path_segments(paths),
+                            hatch_scanlines(paths_bounds(paths), cymk, linewidth))
 
 def parse_path_into_lines(a_path_, lines, x_form_ = ident_xform,
                                    fill_style ='outline', fill_color=[0,0,0,0],
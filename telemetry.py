@@ -0,0 +1,81 @@
+"""
+Job telemetry: where the time of a plot goes.
+
+A Metrics object holds counters and seconds spent per stage.
+The plotter only touches it when one is enabled
+(Plotter.enable_metrics), so it costs nothing otherwise,
+and it can stream snapshots to a .csv or .jsonl file
+every so many seconds during the job.
+"""
+import json, time
+
+COUNTERS = ('paths', 'vertices', 'vertices_skipped', 'vertices_clamped',
+            'steps', 'pen_lifts', 'lifts_skipped', 'mode_switches')
+# Seconds in each stage. Switching the PWM mode happens within
+# I2C writes, so mode_switch is part of i2c and not a stage.
+STAGES = ('geometry', 'i2c', 'step_wait', 'pen')
+SECONDS = STAGES + ('mode_switch',)
+
+class Metrics:
+    def __init__(self, filename=None, every=10., timer=None):
+        """
+        Args:
+            filename: optional .csv or .jsonl file snapshots are appended to.
+            every: seconds between streamed snapshots.
+            timer: function giving the time, defaults to time.perf_counter
+        """
+        self.timer = time.perf_counter if timer is None else timer
+        self.values = dict.fromkeys(COUNTERS, 0)
+        self.values.update(dict.fromkeys(SECONDS, 0.))
+        self.every = every
+        self.filename = filename
+        self.f = None
+        self.csv = filename is not None and filename.endswith('.csv')
+        self.t0 = self.timer()
+        self.last = self.t0
+    def add(self, key, value=1):
+        self.values[key] += value
+    def __getitem__(self, key):
+        return self.values[key]
+    def snapshot(self):
+        """
+        The metrics as a dict, with the elapsed seconds
+        and the seconds not in any stage ('other').
+        """
+        tore = dict(self.values)
+        tore['elapsed'] = self.timer() - self.t0
+        tore['other'] = tore['elapsed'] - sum(self.values[K] for K in STAGES)
+        return tore
+    def due(self):
+        """
+        True when a snapshot should be streamed.
+        """
+        return self.filename is not None and self.timer() - self.last >= self.every
+    def write(self):
+        """
+        Appends a snapshot to the file.
+        """
+        if (self.filename is None):
+            return
+        row = self.snapshot()
+        self.last = self.timer()
+        if (self.f is None):
+            self.f = open(self.filename, 'a')
+            # Appending to an earlier run's file keeps its header.
+            if (self.csv and self.f.tell()==0):
+                self.f.write(",".join(row.keys())+"\n")
+        if (self.csv):
+            self.f.write(",".join(str(V) for V in row.values())+"\n")
+        else:
+            self.f.write(json.dumps(row)+"\n")
+        self.f.flush()
+    def close(self):
+        if (self.f is not None):
+            self.f.close()
+            self.f = None
+    def __str__(self):
+        S = self.snapshot()
+        tore = "Elapsed {:.1f}s: ".format(S['elapsed'])
+        tore += " ".join("{} {:.1f}s".format(K, S[K]) for K in SECONDS+('other',))
+        tore += "\n" + " ".join("{} {}".format(K, S[K]) for K in COUNTERS)
+        return tore
@@ -0,0 +1,70 @@
+"""
+Checkpoints of plot_file on the simulated plotter.
+"""
+import os, pickle, sys
+import numpy as np
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+import checkpoint, plotter
+
+def job(tmp_path, n=6):
+    rng = np.random.default_rng(0)
+    paths = [(rng.random(2)*40 + np.cumsum(rng.normal(0, 1, (10,2)), 0)).tolist() for K in range(n)]
+    filename = str(tmp_path / "job.pkl")
+    with open(filename, 'wb') as f:
+        pickle.dump(paths, f)
+    return filename
+
+def plotted(filename, resume=False):
+    pl = plotter.Plotter(sim=True, join_tol=0)
+    pl.enable_metrics()
+    pl.plot_file(filename, resume=resume)
+    return pl
+
+def test_finished_job_leaves_no_checkpoint(tmp_path):
+    filename = job(tmp_path)
+    plotted(filename)
+    assert not os.path.exists(filename+".ckpt")
+
+def test_finished_checkpoint_starts_over(tmp_path, capsys):
+    filename = job(tmp_path)
+    C = checkpoint.Checkpointer(filename+".ckpt").open()
+    C.channel = 1
+    C.write(0, 0, 0, 1)
+    C.close()
+    pl = plotted(filename, resume=True)
+    assert "starting over" in capsys.readouterr().out
+    assert pl.metrics['paths'] == 6
+    assert not os.path.exists(filename+".ckpt")
+
+def test_resume_warns_on_moved_vertex(tmp_path, capsys):
+    filename = job(tmp_path)
+    C = checkpoint.Checkpointer(filename+".ckpt").open()
+    C.path = 3
+    C.write(2, 10**6, -10**6, 0)
+    C.close()
+    pl = plotted(filename, resume=True)
+    out = capsys.readouterr().out
+    assert "Resuming channel 0 path 3 vertex 2" in out
+    assert "WARNING: the checkpoint had the pen" in out
+    assert pl.metrics['paths'] == 3
+
+def test_resume_from_a_real_checkpoint(tmp_path, capsys, monkeypatch):
+    filename = job(tmp_path)
+    monkeypatch.setattr(plotter.os, 'remove', lambda name: None)
+    pl = plotter.Plotter(sim=True, join_tol=0, checkpoint_every=1e-6)
+    pl.plot_file(filename)
+    monkeypatch.undo()
+    # Cut the job off in the middle of path 3.
+    size = checkpoint.RECORD.size
+    with open(filename+".ckpt", 'rb') as f:
+        records = [checkpoint.RECORD.unpack(f.read(size)) for K in range(os.path.getsize(filename+".ckpt")//size)]
+    K = [I for I, R in enumerate(records) if R[2]==3 and R[3]>0][0]
+    with open(filename+".ckpt", 'r+b') as f:
+        f.truncate((K+1)*size)
+    capsys.readouterr()
+    plotted(filename, resume=True)
+    out = capsys.readouterr().out
+    assert "Resuming channel 0 path 3" in out
+    assert "WARNING" not in out
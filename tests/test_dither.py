@@ -0,0 +1,30 @@
+"""
+The wavefront floyd_steinberg against the pixel loop it replaced.
+"""
+import os, sys
+import numpy as np
+import pytest
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+import lineifiers
+
+SHAPES = [(1,1), (1,7), (7,1), (2,11), (5,3), (13,9), (6,6)]
+
+def image(shape, dtype, seed=0):
+    rng = np.random.default_rng(seed)
+    if (dtype == np.uint8):
+        return rng.integers(0, 256, shape).astype(np.uint8)
+    return rng.random(shape)*255.
+
+@pytest.mark.parametrize("alg", sorted(lineifiers.DIFFUSION_KERNELS) + ['unknown'])
+@pytest.mark.parametrize("dtype", [np.uint8, np.float64])
+@pytest.mark.parametrize("channels", [None, 3])
+def test_floyd_steinberg_matches_loop(alg, dtype, channels):
+    for shape in SHAPES:
+        if (channels is not None):
+            shape = shape + (channels,)
+        X = image(shape, dtype)
+        out = lineifiers.floyd_steinberg(X, alg=alg)
+        assert out.shape == X.shape
+        assert np.array_equal(out, lineifiers.floyd_steinberg_loop(X, alg=alg))
@@ -0,0 +1,87 @@
+"""
+Lineifier output, pickled, through Plotter.plot_file
+on the simulated plotter (Plotter(sim=True)).
+"""
+import os, pickle, sys
+import numpy as np
+import pytest
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+import matplotlib
+matplotlib.use('Agg')
+import lineifiers, plotter
+
+def dithered(n=12, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.random((n, n, 4)) > 0.7).astype(np.float64)
+
+def plot_pickle(tmp_path, DATA):
+    filename = str(tmp_path / "job.pkl")
+    with open(filename, 'wb') as f:
+        pickle.dump(DATA, f)
+    pl = plotter.Plotter(sim=True)
+    pl.enable_metrics()
+    pl.plot_file(filename, estimate=False)
+    return pl
+
+@pytest.mark.parametrize("linify", [
+    lambda img: lineifiers.random_ngon_linify(img, seed=0),
+    lambda img: lineifiers.random_dash_linify(img, random=True, seed=0),
+    lambda img: lineifiers.raster_linify(img),
+])
+def test_cymk_linify_plots(tmp_path, capsys, linify):
+    channels = linify(dithered())
+    for DATA in [list(channels), tuple(channels)]:
+        assert plotter.path_file.is_cymk(DATA)
+        pl = plot_pickle(tmp_path, DATA)
+        out = capsys.readouterr().out
+        for name in ["Cyan", "Yellow", "Magenta", "Black"]:
+            assert "Load "+name in out
+        assert pl.metrics['paths'] > 0
+        assert pl.metrics['vertices'] >= 2*pl.metrics['paths']
+
+def test_mono_linify_plots(tmp_path):
+    paths = lineifiers.raster_linify(dithered()[:,:,0])
+    pl = plot_pickle(tmp_path, paths)
+    assert pl.metrics['paths'] > 0
+    bds = pl.paths_bounds(paths)
+    assert bds == np.concatenate([paths.reshape(-1,2).min(0), paths.reshape(-1,2).max(0)]).tolist()
+
+def test_pre_process_cymk(capsys):
+    pl = plotter.Plotter(sim=True)
+    DATA = list(lineifiers.random_ngon_linify(dithered(), seed=0))
+    OPATHS = pl.pre_process(DATA)
+    assert len(OPATHS) == 4
+    assert [len(C) for C in OPATHS] == [len(C) for C in DATA]
+
+def grid_lines(seed=0, processes=None):
+    rng = np.random.default_rng(1)
+    from scipy import ndimage
+    img = ndimage.gaussian_filter(rng.random((40,40)), 3)*200.
+    return lineifiers.grid_lineify(img, (0,40), (0,40), ntraj=100, max_step=50,
+                                   gamma=0.08, e0=0.03, e_thresh=0.006, m=6,
+                                   seed=seed, processes=processes, batch=32)
+
+def test_grid_lineify_plots(tmp_path, capsys):
+    DATA = [grid_lines(seed=C) for C in range(4)]
+    assert plotter.path_file.is_cymk(DATA)
+    pl = plot_pickle(tmp_path, DATA)
+    assert "Load Black" in capsys.readouterr().out
+    assert pl.metrics['paths'] > 0
+
+def test_grid_lineify_processes():
+    serial = grid_lines(seed=5)
+    pooled = grid_lines(seed=5, processes=2)
+    assert len(serial) == len(pooled)
+    assert all(np.array_equal(a, b) for a, b in zip(serial, pooled))
+
+def test_random_ngons_are_closed():
+    for P in lineifiers.random_ngon_linify(dithered(), n_min=3, n_max=6, seed=0):
+        assert P.shape[1:] == (7,2)
+        for ngon in P:
+            # A k-gon, then its first vertex until the end, like ngon(closed=True).
+            k = int(np.argmax(np.all(np.isclose(ngon[1:], ngon[0]), -1))) + 1
+            assert 3 <= k <= 6
+            assert np.allclose(ngon[k:], ngon[0])
+            assert len(np.unique(np.round(ngon[:k], 9), axis=0)) == k
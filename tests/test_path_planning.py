@@ -0,0 +1,25 @@
+"""
+Joining paths, eagerly and lazily.
+"""
+import os, pickle, sys
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+import path_planning, plotter
+
+PATHS = [[[20.,20.],[25.,20.]], [[25.,20.01],[25.,25.]], [[30.,30.],[35.,30.]], [[1.,1.]]]
+
+def test_iter_join_paths_counts_joins():
+    stats = {}
+    joined = list(path_planning.iter_join_paths(iter(PATHS), 0.05, stats))
+    eager, n_saved = path_planning.join_paths(PATHS, 0.05)
+    assert len(joined) == len(eager) == 2
+    assert stats == {'paths': 3, 'joins': n_saved}
+
+def test_plot_file_reports_joins(tmp_path, capsys):
+    filename = str(tmp_path / "job.pkl")
+    with open(filename, 'wb') as f:
+        pickle.dump(PATHS, f)
+    pl = plotter.Plotter(sim=True, join_tol=0.05)
+    pl.plot_file(filename)
+    assert "Joined 3 paths into 2, saved 1 lifts" in capsys.readouterr().out
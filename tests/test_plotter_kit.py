@@ -0,0 +1,48 @@
+"""
+Stepper coil writes against the RecordingI2C bus.
+"""
+import os, struct, sys
+import pytest
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+pytest.importorskip("adafruit_register")
+import plotter_kit
+
+def channel_regs(bus, index):
+    return struct.unpack_from('<HH', bus.regs, 0x06 + 4*index)
+
+def kit():
+    bus = plotter_kit.RecordingI2C()
+    return bus, plotter_kit.PlotterKit(i2c=bus)
+
+@pytest.mark.parametrize("style", [plotter_kit.SINGLE, plotter_kit.DOUBLE,
+                                   plotter_kit.INTERLEAVE, plotter_kit.MICROSTEP])
+def test_step_is_one_burst(style):
+    bus, K = kit()
+    for stepper in (K.stepper1, K.stepper2):
+        for direction in (plotter_kit.FORWARD, plotter_kit.BACKWARD):
+            for step in range(12):
+                bus.clear()
+                stepper.onestep(direction=direction, style=style)
+                assert len(bus.transactions) == 1
+                duty_cycles = stepper._duty_cycles()
+                for coil, duty in zip(stepper._coil, duty_cycles):
+                    assert channel_regs(bus, coil._index) == plotter_kit._duty_regs(duty)
+    # The enable channels are held full on.
+    for index in (2, 7, 8, 13):
+        assert channel_regs(bus, index) == (0x1000, 0)
+
+def test_steps_write_only_changed_coils():
+    bus, K = kit()
+    stepper = K.stepper1
+    for style in (plotter_kit.SINGLE, plotter_kit.DOUBLE, plotter_kit.MICROSTEP):
+        bus.clear()
+        n_steps = 64
+        for step in range(n_steps):
+            stepper.onestep(direction=plotter_kit.BACKWARD, style=style)
+        # Each (on, off) channel is 4 bytes after the register address.
+        written = sum((len(data)-1)//4 for address, data in bus.transactions)
+        assert written < 4*n_steps
+    # A microstep changes at most 3 of the 4 coils.
+    assert written <= 3*n_steps
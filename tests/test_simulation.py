@@ -0,0 +1,18 @@
+"""
+Rendering a simulated pen trace.
+"""
+import os, sys
+import numpy as np
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+import simulation
+
+def test_render_trace_keeps_the_backend(tmp_path):
+    import matplotlib
+    backend = matplotlib.get_backend()
+    trace = np.array([[0., 20., 20., 1], [1., 25., 20., 0], [2., 25., 25., 0]])
+    filename = str(tmp_path / "trace.png")
+    assert simulation.render_trace(trace, filename, (18., 62.), (10., 38.)) == 2
+    assert os.path.getsize(filename) > 0
+    assert matplotlib.get_backend() == backend
@@ -0,0 +1,29 @@
+"""
+Metrics snapshots streamed to a file.
+"""
+import os, sys
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+import plotter, telemetry
+
+def test_csv_header_written_once(tmp_path):
+    filename = str(tmp_path / "metrics.csv")
+    for run in range(2):
+        metrics = telemetry.Metrics(filename)
+        metrics.write()
+        metrics.write()
+        metrics.close()
+    with open(filename) as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 5
+    assert lines[0].startswith("paths,")
+    assert not any(L.startswith("paths,") for L in lines[1:])
+
+def test_cycled_draw_counts_its_vertices():
+    pl = plotter.Plotter(sim=True)
+    pl.enable_metrics()
+    pl.draw_rect(20., 30., 15., 25.)
+    assert pl.metrics['paths'] == 1
+    assert pl.metrics['vertices'] == 4
+    assert pl.metrics['vertices_skipped'] == 0